@@ -0,0 +1,423 @@
+"""
+Benchmark suite for the trivia API
+
+Builds a synthetic question bank (1k, 100k or 1m questions) in a
+temporary SQLite database, or in the database given by --database-url,
+then measures throughput and p50/p95/p99 latency for every endpoint,
+either through the Flask test client ("client") or over HTTP against a
+threaded WSGI server ("server"). It also times startup: importing
+flaskr in a fresh interpreter, create_app() and the first request.
+Results are written as JSON so runs can be compared between commits:
+
+    python benchmark.py --scale 100k --mode client server --output new.json
+    python benchmark.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+SCALES = {"1k": 1000, "100k": 100000, "1m": 1000000}
+CATEGORIES = ["Science", "Art", "Geography", "History", "Entertainment",
+              "Sports"]
+WORDS = ["what", "which", "who", "title", "largest", "first", "river",
+         "movie", "painting", "planet", "country", "team", "world", "cup",
+         "artist", "invented", "discovered", "capital", "ocean", "element",
+         "novel", "composer", "battle", "empire", "mountain", "language",
+         "actor", "album", "record", "olympic", "famous", "ancient"]
+INSERT_CHUNK = 10000
+WRITE_MARKER = "benchmark write"
+FIXTURE_CHUNK = 500
+IMPORT_ROWS = 10
+BULK_DELETE_IDS = 10
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_request(self, *args):
+        pass
+
+"""
+generate(database_url, size, seed)
+    creates the schema and fills categories and questions with `size`
+    reproducible random questions
+"""
+def generate(database_url, size, seed=0):
+    from sqlalchemy import create_engine
+    from models import db, Question, Category
+    engine = create_engine(database_url)
+    db.Model.metadata.drop_all(engine)
+    db.Model.metadata.create_all(engine)
+    rng = random.Random(seed)
+    with engine.begin() as connection:
+        connection.execute(Category.__table__.insert(),
+                           [{"id": index + 1, "type": category}
+                            for index, category in enumerate(CATEGORIES)])
+        for start in range(0, size, INSERT_CHUNK):
+            connection.execute(Question.__table__.insert(), [{
+                "question": " ".join(rng.choice(WORDS)
+                                     for word in range(8)) + "?",
+                "answer": " ".join(rng.choice(WORDS) for word in range(2)),
+                "difficulty": rng.randint(1, 5),
+                "category": rng.randint(1, len(CATEGORIES))
+            } for index in range(start, min(start + INSERT_CHUNK, size))])
+    engine.dispose()
+
+"""
+WriteFixtures
+    data for the write endpoints, prepared outside their timings:
+    questions to delete, inserted FIXTURE_CHUNK at a time as requests
+    take them, and fresh quiz session tokens. Every question the write
+    endpoints create carries WRITE_MARKER, and cleanup() deletes them
+    all, so each run leaves the bank as it was generated.
+"""
+class WriteFixtures:
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+        self.ids = []
+
+    def question(self, rng):
+        return {
+            "question": "{} {}?".format(WRITE_MARKER, " ".join(
+                rng.choice(WORDS) for word in range(6))),
+            "answer": rng.choice(WORDS),
+            "difficulty": rng.randint(1, 5),
+            "category": rng.randint(1, len(CATEGORIES))
+        }
+
+    def take(self, rng, count=1):
+        if len(self.ids) < count:
+            self.insert(rng, max(count, FIXTURE_CHUNK))
+        taken, self.ids = self.ids[:count], self.ids[count:]
+        return taken
+
+    def insert(self, rng, count):
+        from sqlalchemy import func
+        from models import db, Question
+        with self.app.app_context():
+            before = db.session.query(func.max(Question.id)).scalar() or 0
+            Question.bulk_insert([self.question(rng)
+                                  for index in range(count)])
+            self.ids.extend(question_id for question_id, in db.session.query(
+                Question.id).filter(Question.id > before).filter(
+                Question.question.like(WRITE_MARKER + "%")).order_by(
+                Question.id))
+
+    def session(self, rng):
+        response = self.client.post("/quizzes/sessions", json={
+            "quiz_category": {"id": rng.randint(0, len(CATEGORIES))}})
+        return json.loads(response.data)["session"]
+
+    def cleanup(self):
+        from models import db, Question
+        with self.app.app_context():
+            ids = [question_id for question_id, in db.session.query(
+                Question.id).filter(
+                Question.question.like(WRITE_MARKER + "%"))]
+            for start in range(0, len(ids), INSERT_CHUNK):
+                Question.bulk_delete(ids[start:start + INSERT_CHUNK])
+        self.ids = []
+
+"""
+endpoint_requests(size, fixtures)
+    one request factory per endpoint, the read endpoints first; each
+    takes a random generator and returns a (method, path, body) tuple,
+    where a body is sent as JSON, or as NDJSON when it is a string.
+    The write endpoints draw their questions and sessions from
+    `fixtures`, a WriteFixtures.
+"""
+def endpoint_requests(size, fixtures):
+    pages = max(size // 10, 1)
+    return {
+        "GET /categories": lambda rng: ("GET", "/categories", None),
+        "GET /questions?page": lambda rng: (
+            "GET", "/questions?page={}".format(rng.randint(1, pages)), None),
+        "GET /questions?after": lambda rng: (
+            "GET", "/questions?after={}".format(rng.randint(0, size - 10)),
+            None),
+        "GET /categories/<id>/questions": lambda rng: (
+            "GET", "/categories/{}/questions?page={}".format(
+                rng.randint(1, len(CATEGORIES)), rng.randint(1, 5)), None),
+        "POST /search": lambda rng: (
+            "POST", "/search", {"searchTerm": rng.choice(WORDS)}),
+        "GET /search/suggest": lambda rng: (
+            "GET", "/search/suggest?q={}".format(
+                rng.choice(WORDS)[:rng.randint(1, 4)]), None),
+        "POST /quizzes": lambda rng: (
+            "POST", "/quizzes", {
+                "quiz_category": {"id": rng.randint(0, len(CATEGORIES))},
+                "previous_questions": [rng.randint(1, size)
+                                       for index in range(4)]}),
+        "POST /quizzes/sessions": lambda rng: (
+            "POST", "/quizzes/sessions", {
+                "quiz_category": {"id": rng.randint(0, len(CATEGORIES))}}),
+        "POST /quizzes/sessions/<token>": lambda rng: (
+            "POST", "/quizzes/sessions/" + fixtures.session(rng), None),
+        "GET /questions/export": lambda rng: (
+            "GET", "/questions/export?category={}".format(
+                rng.randint(1, len(CATEGORIES))), None),
+        "GET /stats": lambda rng: ("GET", "/stats", None),
+        "GET /stats/pool": lambda rng: ("GET", "/stats/pool", None),
+        "GET /metrics": lambda rng: ("GET", "/metrics", None),
+        "POST /questions": lambda rng: (
+            "POST", "/questions", fixtures.question(rng)),
+        "DELETE /questions/<id>": lambda rng: (
+            "DELETE", "/questions/{}".format(fixtures.take(rng)[0]), None),
+        "DELETE /questions": lambda rng: (
+            "DELETE", "/questions",
+            {"ids": fixtures.take(rng, BULK_DELETE_IDS)}),
+        "POST /questions/import": lambda rng: (
+            "POST", "/questions/import", "\n".join(
+                json.dumps(fixtures.question(rng))
+                for index in range(IMPORT_ROWS))),
+    }
+
+def percentile(latencies, fraction):
+    index = min(int(len(latencies) * fraction), len(latencies) - 1)
+    return latencies[index]
+
+def summarize(latencies, elapsed, errors):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000
+    }
+
+"""
+run_client(app, make_request, requests, seed)
+    sends `requests` requests one after another through the test client
+"""
+def run_client(app, make_request, requests, seed):
+    client = app.test_client()
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for index in range(requests):
+        method, path, body = make_request(rng)
+        if isinstance(body, str):
+            send = {"data": body, "content_type": "application/x-ndjson"}
+        else:
+            send = {"json": body}
+        start = time.perf_counter()
+        response = client.open(path, method=method, **send)
+        response.get_data()
+        latencies.append(time.perf_counter() - start)
+        response.close()
+        if response.status_code >= 500:
+            errors += 1
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+"""
+run_server(base_url, make_request, requests, concurrency, seed)
+    sends `requests` HTTP requests from `concurrency` threads
+"""
+def run_server(base_url, make_request, requests, concurrency, seed):
+    rng = random.Random(seed)
+    planned = [make_request(rng) for index in range(requests)]
+
+    def send(planned_request):
+        method, path, body = planned_request
+        content_type = "application/json"
+        if isinstance(body, str):
+            data, content_type = body.encode(), "application/x-ndjson"
+        else:
+            data = json.dumps(body).encode() if body is not None else None
+        http_request = urllib.request.Request(
+            base_url + path, data=data, method=method,
+            headers={"Content-Type": content_type})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(http_request) as response:
+                response.read()
+            failed = False
+        except urllib.error.HTTPError as error:
+            failed = error.code >= 500
+        return time.perf_counter() - start, failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, planned))
+    elapsed = time.perf_counter() - started
+    return summarize([latency for latency, failed in results], elapsed,
+                     sum(1 for latency, failed in results if failed))
+
+IMPORT_SCRIPT = ("import time; start = time.perf_counter(); import flaskr; "
+                 "print(time.perf_counter() - start)")
+
+"""
+measure_startup(database_url, runs)
+    median milliseconds to import flaskr in a fresh interpreter, to build
+    an app with create_app() and to serve the app's first request
+"""
+def measure_startup(database_url, runs):
+    from flaskr import create_app
+    backend = os.path.dirname(os.path.abspath(__file__))
+    imports, builds, first_requests = [], [], []
+    for run in range(runs):
+        imports.append(float(subprocess.check_output(
+            [sys.executable, "-c", IMPORT_SCRIPT], cwd=backend)))
+        start = time.perf_counter()
+        app = create_app({"DATABASE_PATH": database_url,
+                          "QUERY_BUDGET_MODE": "off"})
+        builds.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        app.test_client().get("/questions")
+        first_requests.append(time.perf_counter() - start)
+    return {
+        "runs": runs,
+        "import_ms": statistics.median(imports) * 1000,
+        "create_app_ms": statistics.median(builds) * 1000,
+        "first_request_ms": statistics.median(first_requests) * 1000
+    }
+
+def print_startup(startup):
+    print("{:<34} import {:>8.2f}ms  create_app {:>8.2f}ms  "
+          "first request {:>8.2f}ms".format(
+              "startup", startup["import_ms"], startup["create_app_ms"],
+              startup["first_request_ms"]))
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def benchmark(args):
+    from flaskr import create_app
+    size = SCALES[args.scale]
+    database_url = args.database_url
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(
+            tempfile.mkdtemp(), "trivia_bench.db")
+    if not args.skip_generate:
+        generate(database_url, size, args.seed)
+    app = create_app({
+        "DATABASE_PATH": database_url,
+        "QUERY_BUDGET_MODE": "off",
+        "ADMISSION_CONTROL_ENABLED": args.admission_control,
+        "RESPONSE_CACHE_SIZE": args.response_cache_size
+    })
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "database": database_url.split(":", 1)[0],
+        "scale": args.scale,
+        "questions": size,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "endpoints": {}
+    }
+    if args.startup_runs > 0:
+        results["startup"] = measure_startup(database_url, args.startup_runs)
+        print_startup(results["startup"])
+    fixtures = WriteFixtures(app)
+    requests = endpoint_requests(size, fixtures)
+    server = None
+    if "server" in args.mode:
+        server = make_server("127.0.0.1", 0, app, threaded=True,
+                             request_handler=QuietRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        for name, make_request in requests.items():
+            if args.endpoint and name not in args.endpoint:
+                continue
+            results["endpoints"][name] = {}
+            if "client" in args.mode:
+                results["endpoints"][name]["client"] = run_client(
+                    app, make_request, args.requests, args.seed)
+            if server is not None:
+                results["endpoints"][name]["server"] = run_server(
+                    "http://127.0.0.1:{}".format(server.server_port),
+                    make_request, args.requests, args.concurrency, args.seed)
+            fixtures.cleanup()
+            print_endpoint(name, results["endpoints"][name])
+    finally:
+        fixtures.cleanup()
+        if server is not None:
+            server.shutdown()
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    return results
+
+def print_endpoint(name, modes):
+    for mode, stats in sorted(modes.items()):
+        print("{:<34} {:<6} {:>9.1f} req/s  p50 {:>8.2f}ms  p95 {:>8.2f}ms  "
+              "p99 {:>8.2f}ms  errors {}".format(
+                  name, mode, stats["throughput"], stats["p50_ms"],
+                  stats["p95_ms"], stats["p99_ms"], stats["errors"]))
+
+"""
+compare(old, new)
+    prints the relative change in throughput and p95 latency
+    for every endpoint and mode present in both result files
+"""
+def compare(old_path, new_path):
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+    print("{} -> {}".format(old.get("commit"), new.get("commit")))
+    if "startup" in old and "startup" in new:
+        for key in ("import_ms", "create_app_ms", "first_request_ms"):
+            print("{:<34} {:<16} {:>+7.1%}".format(
+                "startup", key, new["startup"][key] / old["startup"][key] - 1))
+    for name, modes in sorted(new["endpoints"].items()):
+        for mode, stats in sorted(modes.items()):
+            before = old["endpoints"].get(name, {}).get(mode)
+            if before is None:
+                continue
+            print("{:<34} {:<6} throughput {:>+7.1%}  p95 {:>+7.1%}".format(
+                name, mode,
+                stats["throughput"] / before["throughput"] - 1,
+                stats["p95_ms"] / before["p95_ms"] - 1))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="1k")
+    parser.add_argument("--database-url", default=None,
+                        help="defaults to a temporary SQLite file; its "
+                        "tables are dropped and regenerated unless "
+                        "--skip-generate is given")
+    parser.add_argument("--skip-generate", action="store_true",
+                        help="reuse the data already in --database-url")
+    parser.add_argument("--mode", nargs="+", choices=["client", "server"],
+                        default=["client"])
+    parser.add_argument("--endpoint", nargs="*", default=None)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--response-cache-size", type=int, default=0,
+                        help="0 measures every request uncached")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--admission-control", action="store_true",
+                        help="keep the per-client rate limits on, which "
+                        "reject most of the benchmark's requests")
+    parser.add_argument("--startup-runs", type=int, default=5,
+                        help="0 skips the startup timings")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        benchmark(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,318 @@
 import os
-from flask import Flask, request, abort, jsonify
+import click
+from flask import Flask, request, abort, jsonify, Response, \
+    stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
-from models import setup_db, Question, Category
+import time
+from sqlalchemy import func, text
+from sqlalchemy.exc import SQLAlchemyError
+from models import setup_db, init_db, add_question_listener, \
+    add_category_listener, pool_stats, database_path, db, Question
+from settings import DB_PRIMARY_STICKY_SECONDS, SECRET_KEY
+import migrations
+from .categories import CategoryCache, CATEGORY_CACHE_TTL
+from .response_cache import ResponseCache, RESPONSE_CACHE_TTL, \
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_MAX_AGE
+from .quiz import QuizSelector, QuizSessions, MAX_QUIZ_BATCH
+from .search import create_search_backend
+from .suggest import SuggestIndex, SUGGEST_INDEX_TTL, SUGGEST_LIMIT, \
+    MAX_SUGGEST_LIMIT
+from .stats import QuestionStats, STATS_TTL
+from .routing import read_only, mark_recent_write, recently_wrote
+from .metrics import Metrics
+from .budget import QueryBudget
+from .admission import AdmissionControl
+from .profiling import RequestProfiler
+from .serialization import FragmentCache, FRAGMENT_CACHE_SIZE, \
+    QUESTION_COLUMNS, encode_questions, json_response
+from .snapshot import QuestionSnapshot, SnapshotSelection, SNAPSHOT_MAX_AGE
+from .bulk import import_questions, export_questions, IMPORT_BATCH_SIZE, \
+    MAX_IMPORT_BATCH_SIZE
+
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+MAX_BULK_DELETE = 1000
+
+"""
+the most SQL statements each endpoint may run with cold caches,
+enforced by QueryBudget (see QUERY_BUDGET_MODE); the import budget is
+for a single batch, each further batch adds one insert
+"""
+QUERY_BUDGETS = {
+    "retrieve_categories": 1,
+    "retrieve_questions": 3,
+    "delete_question": 4,
+    "delete_questions_in_bulk": 4,
+    "create_question": 5,
+    "import_questions_in_bulk": 4,
+    "export_questions_in_bulk": 1,
+    "search_questions": 3,
+    "retrieve_questions_by_category": 2,
+    "retrieve_stats": 2,
+    "retrieve_pool_stats": 0,
+    "retrieve_metrics": 0,
+    "retrive_quiz_questions": 3,
+    "start_quiz_session": 1,
+    "retrieve_quiz_session_question": 3,
+    "suggest_questions": 2
+}
+
+"""
+admission limits of the expensive endpoints: the most requests served at
+once per worker (`concurrency`) and a per-client token bucket of `rate`
+requests a second with bursts of `burst`, enforced by AdmissionControl
+(see ADMISSION_LIMITS)
+"""
+ADMISSION_LIMITS = {
+    "search_questions": {"concurrency": 4, "rate": 10, "burst": 20},
+    "retrive_quiz_questions": {"concurrency": 8, "rate": 20, "burst": 40},
+    "retrieve_quiz_session_question": {"concurrency": 8},
+    "import_questions_in_bulk": {"concurrency": 1},
+    "export_questions_in_bulk": {"concurrency": 2}
+}
 
 QUESTIONS_PER_PAGE = 10
+MAX_QUESTIONS_PER_PAGE = 100
+ESTIMATE_TTL = 60
 
-def paginate_questions(request, fetch_questions):
+"""
+paginate_questions(request, selection)
+    applies the requested page to a question query as LIMIT/OFFSET,
+    so only the rows on that page are loaded, as row tuples, and
+    returns their encoded JSON fragments. The selection may also be
+    a SnapshotSelection, read without a query.
+"""
+def paginate_questions(request, selection):
 
     page = request.args.get("page", 1, type=int)
+    if page < 1:
+        return []
     start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
 
-    questions = [question.format() for question in fetch_questions]
-    current_questions = questions[start:end]
+    if isinstance(selection, SnapshotSelection):
+        fetch_questions = selection.slice(start, QUESTIONS_PER_PAGE)
+    else:
+        fetch_questions = selection.with_entities(*QUESTION_COLUMNS).order_by(
+            Question.id).limit(QUESTIONS_PER_PAGE).offset(start).all()
+    current_questions = encode_questions(fetch_questions)
 
     return current_questions
 
+"""
+paginate_questions_after(request, selection)
+    keyset pagination: seeks past the `after` id on the primary key
+    and returns the page together with the cursor for the next one
+"""
+def paginate_questions_after(request, selection):
+
+    after = request.args.get("after", 0, type=int)
+    limit = request.args.get("limit", QUESTIONS_PER_PAGE, type=int)
+    limit = max(1, min(limit, MAX_QUESTIONS_PER_PAGE))
+
+    if isinstance(selection, SnapshotSelection):
+        fetch_questions = selection.after(after, limit + 1)
+    else:
+        fetch_questions = selection.with_entities(*QUESTION_COLUMNS).filter(
+            Question.id > after).order_by(Question.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(fetch_questions) > limit:
+        fetch_questions = fetch_questions[:limit]
+        next_cursor = fetch_questions[-1].id
+    current_questions = encode_questions(fetch_questions)
+
+    return current_questions, next_cursor
+
+"""
+count_questions(*criterion)
+    runs a single COUNT over the questions matching the criterion
+"""
+def count_questions(*criterion):
+    return db.session.query(func.count(Question.id)).filter(
+        *criterion).scalar()
+
+"""
+estimate_questions()
+    a cheap approximation of the number of questions: the planner
+    estimate on Postgres, otherwise an exact count cached for ESTIMATE_TTL
+"""
+estimated_total = {"value": None, "expires": 0}
+
+def estimate_questions():
+    if db.engine.dialect.name == "postgresql":
+        estimate = db.session.execute(text(
+            "SELECT reltuples::bigint FROM pg_class "
+            "WHERE relname = 'questions'")).scalar()
+        if estimate is not None and estimate > 0:
+            return int(estimate)
+    now = time.monotonic()
+    if estimated_total["value"] is None or now >= estimated_total["expires"]:
+        estimated_total["value"] = count_questions()
+        estimated_total["expires"] = now + ESTIMATE_TTL
+    return estimated_total["value"]
+
 def create_app(test_config=None):
 
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    if test_config is not None:
+        app.config.update(test_config)
+    metrics = None
+    if app.config.get("METRICS_ENABLED", True):
+        metrics = Metrics()
+        metrics.init_app(app)
+    admission_control = AdmissionControl(ADMISSION_LIMITS)
+    admission_control.init_app(app)
+    app.extensions["admission_control"] = admission_control
+    QueryBudget(QUERY_BUDGETS).init_app(app)
+    RequestProfiler().init_app(app)
+    setup_db(app, app.config.get("DATABASE_PATH", database_path))
+    category_cache = CategoryCache(
+        app.config.get("CATEGORY_CACHE_TTL", CATEGORY_CACHE_TTL))
+    add_category_listener(app, category_cache.invalidate)
+    app.extensions["category_cache"] = category_cache
+    response_cache = ResponseCache(
+        app.config.get("RESPONSE_CACHE_TTL", RESPONSE_CACHE_TTL),
+        app.config.get("RESPONSE_CACHE_SIZE", RESPONSE_CACHE_SIZE),
+        app.config.get("RESPONSE_CACHE_MAX_AGE", RESPONSE_CACHE_MAX_AGE))
+    add_question_listener(app, response_cache.bump)
+    add_category_listener(app, response_cache.bump)
+    app.extensions["response_cache"] = response_cache
+    search_backend = create_search_backend(app)
+    add_question_listener(app, search_backend.question_changed)
+    suggest_index = SuggestIndex(
+        app.config.get("SUGGEST_INDEX_TTL", SUGGEST_INDEX_TTL))
+    add_question_listener(app, suggest_index.question_changed)
+    add_category_listener(app, suggest_index.category_changed)
+    app.extensions["suggest_index"] = suggest_index
+    question_stats = QuestionStats(app.config.get("STATS_TTL", STATS_TTL))
+    add_question_listener(app, question_stats.question_changed)
+    question_fragments = FragmentCache(
+        app.config.get("FRAGMENT_CACHE_SIZE", FRAGMENT_CACHE_SIZE))
+    add_question_listener(app, question_fragments.question_changed)
+    app.extensions["question_fragments"] = question_fragments
+    question_snapshot = None
+    if app.config.get("SNAPSHOT_PATH"):
+        question_snapshot = QuestionSnapshot(
+            app.config["SNAPSHOT_PATH"],
+            max_age=app.config.get("SNAPSHOT_MAX_AGE", SNAPSHOT_MAX_AGE))
+        add_question_listener(app, question_snapshot.changed)
+        add_category_listener(app, question_snapshot.changed)
+        app.extensions["question_snapshot"] = question_snapshot
+    if metrics is not None:
+        metrics.add_collector("trivia_category_cache",
+                              "Category cache counters.", category_cache.stats)
+        metrics.add_collector("trivia_response_cache",
+                              "Response cache counters.", response_cache.stats)
+        metrics.add_collector("trivia_question_fragments",
+                              "Question JSON fragment cache counters.",
+                              question_fragments.stats)
+        metrics.add_collector("trivia_db_pool",
+                              "Database connection pool.", pool_stats)
+        metrics.add_collector("trivia_suggest_index",
+                              "Search suggestion index size and lookups.",
+                              suggest_index.stats)
+        metrics.add_collector("trivia_admission",
+                              "Admission control rejections and requests "
+                              "in flight.", admission_control.stats)
+        if question_snapshot is not None:
+            metrics.add_collector("trivia_question_snapshot",
+                                  "Shared question snapshot.",
+                                  question_snapshot.stats)
+
+    """
+    open_snapshot()
+        the mapped question snapshot when SNAPSHOT_PATH is set and the
+        client has not just written, otherwise None
+    """
+    def open_snapshot():
+        if question_snapshot is None or recently_wrote():
+            return None
+        return question_snapshot.open()
+
+    """
+    question_selection(category_id)
+        the questions to page through, optionally of one category:
+        a snapshot selection when the snapshot is available, otherwise
+        a query
+    """
+    def question_selection(category_id=None):
+        snapshot = open_snapshot()
+        if snapshot is not None:
+            return snapshot.select(category_id)
+        if category_id is None:
+            return Question.query
+        return Question.query.filter(Question.category == category_id)
+
+    """
+    compact write responses return only the affected id and the total,
+    skipping the first page of questions. Enabled per request with
+    `compact=true`, or for every request with COMPACT_WRITE_RESPONSES.
+    """
+    def compact_write_response():
+        default = "true" if app.config.get("COMPACT_WRITE_RESPONSES") \
+            else "false"
+        return request.args.get("compact", default).lower() == "true"
+
+    """
+    flask init-db creates the missing tables and search indexes and
+    records the schema as migrated; app startup never touches the schema
+    """
+    @app.cli.command("init-db")
+    def init_db_command():
+        init_db()
+        applied = migrations.upgrade()
+        try:
+            search_backend.create_indexes()
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            print("search indexes unavailable, searches use the in-process "
+                  "index: {}".format(error))
+        print("database ready, applied migrations: {}".format(
+            applied or "none"))
+
+    """
+    flask upgrade-db applies pending schema migrations
+    """
+    @app.cli.command("upgrade-db")
+    def upgrade_db():
+        applied = migrations.upgrade()
+        print("applied migrations: {}".format(applied or "none"))
+
+    """
+    flask import-questions FILE loads an NDJSON or CSV file of questions
+    """
+    @app.cli.command("import-questions")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "format", type=click.Choice(["ndjson", "csv"]),
+                  default=None, help="defaults to the file extension")
+    @click.option("--batch-size", default=IMPORT_BATCH_SIZE, show_default=True)
+    def import_questions_command(path, format, batch_size):
+        if format is None:
+            format = "csv" if path.lower().endswith(".csv") else "ndjson"
+        with open(path, "rb") as stream:
+            report = import_questions(
+                stream, format, category_cache.get(), batch_size)
+        if question_snapshot is not None:
+            question_snapshot.rebuild()
+        print("imported {imported}, rejected {rejected}".format(**report))
+        for error in report["errors"]:
+            print("row {row}: {error}".format(**error))
+
+    """
+    flask export-questions [FILE] writes the question bank as NDJSON or CSV
+    """
+    @app.cli.command("export-questions")
+    @click.argument("output", type=click.File("w"), default="-")
+    @click.option("--format", "format", type=click.Choice(["ndjson", "csv"]),
+                  default="ndjson", show_default=True)
+    @click.option("--category", "category_id", type=int, default=None)
+    def export_questions_command(output, format, category_id):
+        for chunk in export_questions(format, category_id):
+            output.write(chunk)
+    quiz_selector = QuizSelector(snapshot=open_snapshot)
+    add_question_listener(app, quiz_selector.question_changed)
+    quiz_sessions = QuizSessions(
+        quiz_selector, app.config.get("SECRET_KEY") or SECRET_KEY)
     """
     Set up CORS. Allow '*' for origins
     """
@@ -38,24 +328,19 @@ def create_app(test_config=None):
         response.headers.add(
             "Access-Control-Allow-Methods", "GET,PUT,POST,DELETE,OPTIONS"
         )
-        return response
+        return mark_recent_write(response, app.config.get(
+            "DB_PRIMARY_STICKY_SECONDS", DB_PRIMARY_STICKY_SECONDS))
 
     """
     An endpoint to handle GET requests
     for all available categories.
     """
     @app.route("/categories")
+    @response_cache.cached
+    @read_only
     def retrieve_categories():
-        question_type = Category.query.order_by(Category.id)
-        question_types = question_type.all()
-        num_question_type = question_type.count()
-        if  not num_question_type == 0:
-            fetch_question_type = {}
-            index = 0
-            while index < num_question_type:
-                fetch_question_type.update({question_types[index].id: 
-                                            question_types[index].type})
-                index += 1
+        fetch_question_type = category_cache.get()
+        if  not len(fetch_question_type) == 0:
             return jsonify({"success": True, "categories": fetch_question_type})
         else:
              abort(404)
@@ -70,31 +355,39 @@ def create_app(test_config=None):
     ten questions per page and pagination at the 
     bottom of the screen for three pages.
     Clicking on the page numbers should update the questions.
+
+    Passing `after` (with an optional `limit`) switches to cursor mode,
+    which seeks on the question id and returns a `next_cursor`.
+    Passing `estimate=true` returns an estimated `total_questions`.
     """
     @app.route("/questions")
+    @response_cache.cached
+    @read_only
     def retrieve_questions():
-        fetch_question = Question.query.order_by(Question.id)
-        fetch_questions = fetch_question.all()
-        num_selections = fetch_question.count()
-        if not num_selections == 0:
-            question_type = Category.query.order_by(Category.id)
-            question_types = question_type.all()
-            num_question_type = question_type.count()
-            fetch_question_type = {}
-            index = 0
-            while index < num_question_type:
-                fetch_question_type.update({question_types[index].id: 
-                                            question_types[index].type})
-                index += 1
-            if len(paginate_questions(request, fetch_questions)) == 0:
-                abort(404)
-            total_questions = len(Question.query.all())
-            return jsonify({
+        next_cursor = None
+        selection = question_selection()
+        if "after" in request.args:
+            current_questions, next_cursor = paginate_questions_after(
+                request, selection)
+        else:
+            current_questions = paginate_questions(request, selection)
+        if not len(current_questions) == 0:
+            if isinstance(selection, SnapshotSelection):
+                fetch_question_type = selection.snapshot.categories_by_id()
+            else:
+                fetch_question_type = category_cache.get()
+            if request.args.get("estimate", "false").lower() == "true":
+                num_selections = estimate_questions()
+            else:
+                num_selections = question_stats.total_questions()
+            result = {
                 "success": True, 
-                "questions": paginate_questions(request, fetch_questions), 
-                "total_questions": total_questions,
+                "total_questions": num_selections,
                 "categories": fetch_question_type
-            })
+            }
+            if "after" in request.args:
+                result["next_cursor"] = next_cursor
+            return json_response(result, current_questions)
         else:
             abort(404)
 
@@ -111,20 +404,44 @@ def create_app(test_config=None):
             fetch_delete_questions = Question.query.filter(Question.id == question_id).one_or_none()
             if not fetch_delete_questions is None:
                 fetch_delete_questions.delete()
-                fetch_question = Question.query.order_by(Question.id)
-                fetch_questions = fetch_question.all()
-                num_fetch_questions =fetch_question.count()
-                return jsonify({
+                if compact_write_response():
+                    return jsonify({
+                        "success": True,
+                        "deleted": question_id,
+                        "total_questions": question_stats.total_questions()
+                    })
+                num_fetch_questions = question_stats.total_questions()
+                return json_response({
                     "success": True,
                     "deleted": question_id,
-                    "questions": paginate_questions(request, fetch_questions), 
                     "total_questions":num_fetch_questions
-                })
+                }, paginate_questions(request, Question.query))
             else:
                 abort(404)
         except:
             abort(422)
         
+    """
+    An endpoint to DELETE several questions at once.
+    Takes a list of question `ids`, removes them in a single statement
+    and commit, and returns the ids that were actually deleted.
+    """
+    @app.route('/questions', methods=['DELETE'])
+    def delete_questions_in_bulk():
+        body = request.get_json(silent=True) or {}
+        question_ids = body.get('ids')
+        if not isinstance(question_ids, list) or len(question_ids) == 0 or \
+                len(question_ids) > MAX_BULK_DELETE or \
+                not all(type(question_id) is int
+                        for question_id in question_ids):
+            abort(422)
+        deleted = Question.bulk_delete(question_ids)
+        return jsonify({
+            "success": True,
+            "deleted": deleted,
+            "total_questions": question_stats.total_questions()
+        })
+
     """
     An endpoint to POST a new question,
     which will require the question and answer text,
@@ -140,25 +457,79 @@ def create_app(test_config=None):
         if request.get_json().get('question', None) and request.get_json().get('answer', 
         None) and request.get_json().get('difficulty', 
         None) and request.get_json().get('category', None): 
+            try:
+                category = int(request.get_json().get('category'))
+                difficulty = int(request.get_json().get('difficulty'))
+            except (TypeError, ValueError):
+                abort(422)
+            if category not in category_cache.get():
+                abort(422)
             add_new_question = Question(question=request.get_json().get('question', None),
             answer=request.get_json().get('answer', None),
-            difficulty=request.get_json().get('difficulty', None),
-            category=request.get_json().get('category', None))
+            difficulty=difficulty,
+            category=category)
             if add_new_question is None:
                 abort(404)
             add_new_question.insert()
-            fetch_question = Question.query.order_by(Question.id)
-            fetch_questions = fetch_question.all()
-            num_fetch_questions = fetch_question.count()
-            return jsonify({
+            if compact_write_response():
+                return jsonify({
+                    "success": True,
+                    "created": add_new_question.id,
+                    "total_questions": question_stats.total_questions()
+                })
+            num_fetch_questions = question_stats.total_questions()
+            return json_response({
                 "success": True,
                 "created": add_new_question.id,
-                "questions": paginate_questions(request, fetch_questions),
                 "total_questions": num_fetch_questions
-            })
+            }, paginate_questions(request, Question.query))
         else:
             abort(422)
     """
+    An endpoint to import questions in bulk from a streamed NDJSON
+    (the default) or CSV request body, one question per line with the
+    question, answer, difficulty and category fields.
+    Rows are validated as they arrive and inserted in batches of
+    `batch_size`; the response reports every rejected row.
+    """
+    @app.route('/questions/import', methods=['POST'])
+    def import_questions_in_bulk():
+        format = request.args.get("format")
+        if format is None:
+            format = "csv" if request.mimetype == "text/csv" else "ndjson"
+        if format not in ("ndjson", "csv"):
+            abort(422)
+        batch_size = request.args.get(
+            "batch_size", IMPORT_BATCH_SIZE, type=int)
+        if batch_size < 1 or batch_size > MAX_IMPORT_BATCH_SIZE:
+            abort(422)
+        report = import_questions(
+            request.stream, format, category_cache.get(), batch_size)
+        report.update({
+            "success": True,
+            "total_questions": question_stats.total_questions()
+        })
+        return jsonify(report)
+
+    """
+    An endpoint to stream every question, optionally only those of one
+    `category`, as NDJSON (the default) or CSV.
+    """
+    @app.route('/questions/export')
+    @read_only
+    def export_questions_in_bulk():
+        format = request.args.get("format", "ndjson")
+        if format not in EXPORT_MIMETYPES:
+            abort(422)
+        category_id = request.args.get("category", None, type=int)
+        response = Response(
+            stream_with_context(export_questions(format, category_id)),
+            mimetype=EXPORT_MIMETYPES[format])
+        response.headers["Content-Disposition"] = \
+            "attachment; filename=questions.{}".format(format)
+        return response
+
+    """
     An endpoint to get questions based on a search term.
     which will return any questions for whom the search term
     is a substring of the question.
@@ -166,22 +537,48 @@ def create_app(test_config=None):
     TEST: Search by any phrase. The questions list will update to include
     only question that include that string within their question.
     Try using the word "title" to start.
+
+    Results are ranked by the search backend. Passing `includeAnswers`
+    also matches the search term against the answers.
     """
     @app.route('/search', methods=['POST'])
+    @read_only
     def search_questions():
         search_term = request.get_json().get('searchTerm', None)
         if search_term is None:
             abort(422)
-        find_word = Question.question.ilike(f'%{search_term}%')
-        fetch_questions = Question.query.filter(find_word).all()
-        if fetch_questions is None:
+        include_answers = bool(request.get_json().get('includeAnswers', False))
+        page = request.args.get("page", 1, type=int)
+        if page < 1:
             abort(404)
-        num_fetch_questions = len(fetch_questions)
-        return jsonify({
+        fetch_questions, num_fetch_questions = search_backend.search(
+            search_term, include_answers,
+            (page - 1) * QUESTIONS_PER_PAGE, QUESTIONS_PER_PAGE)
+        return json_response({
             "success": True,
-            "questions": paginate_questions(request, fetch_questions),
             "total_questions":num_fetch_questions,
             "current_category": None
+        }, encode_questions(fetch_questions))
+
+    """
+    An endpoint to suggest completions while a search term is typed.
+    Completes the last word of `q` from the words of the questions and
+    the category names, most used first, returning up to `limit` of
+    them as the full search term.
+    """
+    @app.route('/search/suggest')
+    @read_only
+    def suggest_questions():
+        head, space, prefix = request.args.get("q", "").rpartition(" ")
+        limit = request.args.get("limit", SUGGEST_LIMIT, type=int)
+        limit = max(1, min(limit, MAX_SUGGEST_LIMIT))
+        suggestions = []
+        if prefix.strip():
+            suggestions = [head + space + completion for completion
+                           in suggest_index.complete(prefix.strip(), limit)]
+        return jsonify({
+            "success": True,
+            "suggestions": suggestions
         })
 
     """
@@ -192,20 +589,50 @@ def create_app(test_config=None):
     category to be shown.
     """
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
+    @response_cache.cached
+    @read_only
     def retrieve_questions_by_category(category_id):
         if category_id is None:
             abort(422)
-        fetch_questions = Question.query.filter(
-            Question.category == str(category_id)).all()
-        if fetch_questions is None:
-            abort(404)
-        num_fetch_questions = len(fetch_questions)
-        return jsonify({
+        fetch_questions = question_selection(category_id)
+        num_fetch_questions = question_stats.category_total(category_id)
+        return json_response({
             "success": True,
             "current_category": category_id,
-            "questions": paginate_questions(request, fetch_questions),
             "total_questions": num_fetch_questions
-        })
+        }, paginate_questions(request, fetch_questions))
+
+    """
+    An endpoint to get the number of questions in total,
+    per category and per difficulty.
+    """
+    @app.route('/stats')
+    @read_only
+    def retrieve_stats():
+        stats = question_stats.snapshot()
+        stats["success"] = True
+        return jsonify(stats)
+
+    """
+    An endpoint to get live statistics of the database connection pool:
+    connections checked in and out, overflow in use, and how many
+    checkouts had to wait for a connection and for how long in total.
+    """
+    @app.route('/stats/pool')
+    def retrieve_pool_stats():
+        stats = pool_stats()
+        stats["success"] = True
+        return jsonify(stats)
+
+    """
+    An endpoint to get request, SQL, cache and pool metrics
+    in the Prometheus text format.
+    """
+    @app.route('/metrics')
+    def retrieve_metrics():
+        if metrics is None:
+            abort(404)
+        return metrics.response()
 
     """
     An endpoint to get questions to play the quiz.
@@ -216,34 +643,80 @@ def create_app(test_config=None):
     TEST: In the "Play" tab, after a user selects "All" or a category,
     one question at a time is displayed, the user is allowed to answer
     and shown whether they were correct or not.
+
+    Passing `count` returns up to that many distinct questions in
+    `questions`, so a whole game can be fetched in one request.
     """
     @app.route('/quizzes', methods=['POST'])
+    @read_only
     def retrive_quiz_questions():
         question_type = request.get_json().get('quiz_category')
         last_quiz = request.get_json().get('previous_questions')
         if question_type and last_quiz is None:
             abort(422)
         question_type_id = question_type['id']
-        fetch_different_questions = Question.id.notin_((last_quiz))
-        if question_type_id == 0:
-            fetch_question = Question.query.filter(fetch_different_questions)
-            fetch_all_questions = fetch_question.all()
-        else:
-            fetch_question = Question.query.filter_by(
-                category = question_type_id).filter(fetch_different_questions)
-            fetch_all_questions = fetch_question.all()
-        len_questions = len(fetch_all_questions)
-        if len_questions <= 0:
+        count = request.get_json().get('count')
+        if count is not None:
+            if not isinstance(count, int) or count < 1:
+                abort(422)
+            fetch_questions = quiz_selector.next_questions(
+                question_type_id, last_quiz, min(count, MAX_QUIZ_BATCH))
+            format_questions = [question.format()
+                                for question in fetch_questions]
+            return jsonify({
+                "success": True,
+                "question": format_questions[0] if format_questions else None,
+                "questions": format_questions
+            })
+        random_questions = quiz_selector.next_question(
+            question_type_id, last_quiz)
+        if random_questions is None:
             return jsonify({"success": True, "question": None})
         else:
-            random_questions = fetch_all_questions[
-                random.randrange(0, len_questions)]
             format_questions = random_questions.format()
             return jsonify({
                 "success": True, 
                 "question": format_questions
             })
 
+    """
+    An endpoint to start a quiz session for a category.
+    The returned session token is then used to fetch questions,
+    so the client no longer sends the previous questions every round.
+    """
+    @app.route('/quizzes/sessions', methods=['POST'])
+    @read_only
+    def start_quiz_session():
+        question_type = request.get_json().get('quiz_category')
+        if question_type is None or question_type.get('id') is None:
+            abort(422)
+        token = quiz_sessions.start(question_type['id'])
+        return jsonify({
+            "success": True,
+            "session": token,
+            "expires_in": quiz_sessions.ttl
+        })
+
+    """
+    An endpoint to get the next unseen question of a quiz session,
+    with the session token to send for the question after it.
+    """
+    @app.route('/quizzes/sessions/<token>', methods=['POST'])
+    @read_only
+    def retrieve_quiz_session_question(token):
+        try:
+            random_questions, token = quiz_sessions.next_question(token)
+        except KeyError:
+            abort(404)
+        if random_questions is None:
+            return jsonify({"success": True, "question": None,
+                            "session": token})
+        return jsonify({
+            "success": True,
+            "question": random_questions.format(),
+            "session": token
+        })
+
     """
     ERROR HANDLERS 
     """
@@ -283,4 +756,26 @@ def create_app(test_config=None):
                 "message": "method not allowed"}),
             405,
         )
+    """
+    error handlers for 429 and 503.
+    """
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        return (
+            jsonify({
+                "success": False, 
+                "error": 429, 
+                "message": "too many requests"}),
+            429,
+        )
+
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        return (
+            jsonify({
+                "success": False, 
+                "error": 503, 
+                "message": "service unavailable"}),
+            503,
+        )
     return app
\ No newline at end of file
@@ -0,0 +1,140 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import abort, g, jsonify, make_response, request
+
+RETRY_AFTER = 1
+MAX_CLIENT_BUCKETS = 10000
+
+"""
+ConcurrencyLimit
+    the number of requests of one endpoint in progress in this worker,
+    admitted up to `limit` at a time
+"""
+class ConcurrencyLimit:
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.in_flight >= self.limit:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+"""
+RateLimit
+    a token bucket per client: each client gets `rate` requests a
+    second, with bursts of up to `burst`. Only the `max_clients` most
+    recently seen clients are tracked.
+"""
+class RateLimit:
+
+    def __init__(self, rate, burst=None, max_clients=MAX_CLIENT_BUCKETS):
+        self.rate = rate
+        self.burst = burst or rate
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    """
+    take(client)
+        takes a token from the client's bucket and returns 0, or returns
+        the seconds until the bucket holds a token again
+    """
+    def take(self, client):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.rejected += 1
+            self.buckets[client] = (tokens, now)
+            while len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        return wait
+
+"""
+reject(status, message, retry_after)
+    aborts the request with a JSON error response telling the client
+    to retry after `retry_after` seconds
+"""
+def reject(status, message, retry_after):
+    abort(make_response(jsonify({
+        "success": False,
+        "error": status,
+        "message": message
+    }), status, {"Retry-After": str(retry_after)}))
+
+"""
+AdmissionControl
+    sheds load on expensive endpoints instead of queueing it. `limits`
+    maps an endpoint to its `concurrency`, the most requests served at
+    once per worker, and optionally a per-client `rate` and `burst`,
+    merged with the ADMISSION_LIMITS config. A client over its rate gets
+    a 429 and a request over the concurrency limit a 503, both with a
+    Retry-After header. Set ADMISSION_CONTROL_ENABLED to False to
+    turn it off.
+"""
+class AdmissionControl:
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.concurrency = {}
+        self.rates = {}
+
+    def init_app(self, app):
+        if not app.config.get("ADMISSION_CONTROL_ENABLED", True):
+            return
+        limits = dict(self.limits, **app.config.get("ADMISSION_LIMITS", {}))
+        for endpoint, limit in limits.items():
+            if limit.get("concurrency"):
+                self.concurrency[endpoint] = ConcurrencyLimit(
+                    limit["concurrency"])
+            if limit.get("rate"):
+                self.rates[endpoint] = RateLimit(limit["rate"],
+                                                 limit.get("burst"))
+        app.before_request(self.admit)
+        app.teardown_request(self.release)
+
+    def admit(self):
+        rate = self.rates.get(request.endpoint)
+        if rate is not None:
+            wait = rate.take(request.remote_addr)
+            if wait:
+                reject(429, "too many requests", math.ceil(wait))
+        concurrency = self.concurrency.get(request.endpoint)
+        if concurrency is not None:
+            if not concurrency.acquire():
+                reject(503, "service unavailable", RETRY_AFTER)
+            g.admission_slot = concurrency
+
+    def release(self, error=None):
+        slot = g.pop("admission_slot", None)
+        if slot is not None:
+            slot.release()
+
+    def stats(self):
+        stats = {}
+        for endpoint, concurrency in self.concurrency.items():
+            stats[endpoint + "_in_flight"] = concurrency.in_flight
+            stats[endpoint + "_concurrency_rejected"] = concurrency.rejected
+        for endpoint, rate in self.rates.items():
+            stats[endpoint + "_rate_rejected"] = rate.rejected
+            stats[endpoint + "_clients"] = len(rate.buckets)
+        return stats
@@ -0,0 +1,224 @@
+import time
+from contextlib import asynccontextmanager
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from models import database_path, Question, Category
+from .quiz import QuizSelector, IdPool, normalize_id, MAX_QUIZ_BATCH
+
+QUESTIONS_PER_PAGE = 10
+
+questions = Question.__table__
+categories = Category.__table__
+
+ERROR_MESSAGES = {
+    404: "resource not found",
+    405: "method not allowed",
+    422: "unprocessable"
+}
+
+"""
+async_database_url(url)
+    maps a synchronous database URL to its async driver:
+    postgresql to asyncpg and sqlite to aiosqlite
+"""
+def async_database_url(url):
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+"""
+AsyncQuizSelector
+    the QuizSelector id pools, loaded through an async connection
+"""
+class AsyncQuizSelector(QuizSelector):
+
+    async def ensure_fresh(self, connection):
+        if time.monotonic() < self.expires:
+            return
+        result = await connection.stream(
+            select(questions.c.id, questions.c.category))
+        self.load([tuple(row) async for row in result])
+
+    def pool(self, category_id):
+        return self.pools.get(normalize_id(category_id), IdPool())
+
+def format_question(row):
+    return {
+        'id': row.id,
+        'question': row.question,
+        'answer': row.answer,
+        'category': row.category,
+        'difficulty': row.difficulty
+    }
+
+def page_offset(request):
+    try:
+        page = int(request.query_params.get("page", 1))
+    except ValueError:
+        page = 1
+    if page < 1:
+        raise HTTPException(404)
+    return (page - 1) * QUESTIONS_PER_PAGE
+
+async def json_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(422)
+    if not isinstance(body, dict):
+        raise HTTPException(422)
+    return body
+
+"""
+create_async_app(database_url)
+    an ASGI application serving the read endpoints of create_app
+    (categories, questions, search, category questions and quizzes)
+    with the same JSON contracts, on an async SQLAlchemy engine
+    (asyncpg on Postgres, aiosqlite for tests). Run it with
+    `uvicorn --factory flaskr.asgi:create_async_app`.
+"""
+def create_async_app(database_url=None):
+    engine = create_async_engine(
+        async_database_url(database_url or database_path))
+    quiz_selector = AsyncQuizSelector()
+
+    async def fetch_categories(connection):
+        result = await connection.execute(
+            select(categories.c.id, categories.c.type).order_by(
+                categories.c.id))
+        return dict((row.id, row.type) for row in result)
+
+    async def fetch_page(connection, criterion, offset):
+        selection = select(questions)
+        count = select(func.count(questions.c.id))
+        if criterion is not None:
+            selection = selection.where(criterion)
+            count = count.where(criterion)
+        result = await connection.execute(selection.order_by(
+            questions.c.id).limit(QUESTIONS_PER_PAGE).offset(offset))
+        current_questions = [format_question(row) for row in result]
+        total = (await connection.execute(count)).scalar()
+        return current_questions, total
+
+    async def retrieve_categories(request):
+        async with engine.connect() as connection:
+            fetch_question_type = await fetch_categories(connection)
+        if len(fetch_question_type) == 0:
+            raise HTTPException(404)
+        return JSONResponse({
+            "success": True,
+            "categories": fetch_question_type
+        })
+
+    async def retrieve_questions(request):
+        offset = page_offset(request)
+        async with engine.connect() as connection:
+            current_questions, total = await fetch_page(
+                connection, None, offset)
+            if len(current_questions) == 0:
+                raise HTTPException(404)
+            fetch_question_type = await fetch_categories(connection)
+        return JSONResponse({
+            "success": True,
+            "questions": current_questions,
+            "total_questions": total,
+            "categories": fetch_question_type
+        })
+
+    async def search_questions(request):
+        search_term = (await json_body(request)).get('searchTerm', None)
+        if search_term is None:
+            raise HTTPException(422)
+        offset = page_offset(request)
+        async with engine.connect() as connection:
+            current_questions, total = await fetch_page(
+                connection, questions.c.question.ilike(f'%{search_term}%'),
+                offset)
+        return JSONResponse({
+            "success": True,
+            "questions": current_questions,
+            "total_questions": total,
+            "current_category": None
+        })
+
+    async def retrieve_questions_by_category(request):
+        category_id = request.path_params["category_id"]
+        offset = page_offset(request)
+        async with engine.connect() as connection:
+            current_questions, total = await fetch_page(
+                connection, questions.c.category == category_id, offset)
+        return JSONResponse({
+            "success": True,
+            "current_category": category_id,
+            "questions": current_questions,
+            "total_questions": total
+        })
+
+    async def retrive_quiz_questions(request):
+        body = await json_body(request)
+        question_type = body.get('quiz_category')
+        last_quiz = body.get('previous_questions')
+        count = body.get('count')
+        if question_type is None or last_quiz is None:
+            raise HTTPException(422)
+        if count is not None and (not isinstance(count, int) or count < 1):
+            raise HTTPException(422)
+        seen = set(normalize_id(question_id) for question_id in last_quiz)
+        question_ids = []
+        async with engine.connect() as connection:
+            await quiz_selector.ensure_fresh(connection)
+            while len(question_ids) < min(count or 1, MAX_QUIZ_BATCH):
+                question_id = quiz_selector.next_question_id(
+                    question_type['id'], seen)
+                if question_id is None:
+                    break
+                seen.add(question_id)
+                question_ids.append(question_id)
+            result = await connection.execute(
+                select(questions).where(questions.c.id.in_(question_ids)))
+            by_id = dict((row.id, format_question(row)) for row in result)
+        format_questions = [by_id[question_id] for question_id in question_ids
+                            if question_id in by_id]
+        response = {
+            "success": True,
+            "question": format_questions[0] if format_questions else None
+        }
+        if count is not None:
+            response["questions"] = format_questions
+        return JSONResponse(response)
+
+    async def http_error(request, error):
+        status_code = error.status_code if error.status_code in \
+            ERROR_MESSAGES else 500
+        return JSONResponse({
+            "success": False,
+            "error": status_code,
+            "message": ERROR_MESSAGES.get(status_code, "server error")
+        }, status_code=status_code)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await engine.dispose()
+
+    return Starlette(
+        routes=[
+            Route("/categories", retrieve_categories),
+            Route("/questions", retrieve_questions),
+            Route("/search", search_questions, methods=["POST"]),
+            Route("/categories/{category_id:int}/questions",
+                  retrieve_questions_by_category),
+            Route("/quizzes", retrive_quiz_questions, methods=["POST"]),
+        ],
+        middleware=[Middleware(CORSMiddleware, allow_origins=["*"],
+                               allow_methods=["*"], allow_headers=["*"])],
+        exception_handlers={HTTPException: http_error},
+        lifespan=lifespan)
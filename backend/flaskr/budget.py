@@ -0,0 +1,123 @@
+import threading
+import warnings
+from contextlib import contextmanager
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+QUERY_COUNT_HEADER = "X-Query-Count"
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+"""
+QueryCounter
+    counts the SQL statements executed on the current thread while it
+    is active, keeping the first few statements for error messages
+"""
+class QueryCounter:
+
+    kept_statements = 20
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def record(self, statement):
+        self.count += 1
+        if len(self.statements) < self.kept_statements:
+            self.statements.append(" ".join(statement.split()))
+
+active = threading.local()
+
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(active, "counters", ()):
+        counter.record(statement)
+
+query_events = {"registered": False}
+
+def register_query_events():
+    if query_events["registered"]:
+        return
+    event.listen(Engine, "after_cursor_execute", record_query)
+    query_events["registered"] = True
+
+def push_counter():
+    register_query_events()
+    counter = QueryCounter()
+    if not hasattr(active, "counters"):
+        active.counters = []
+    active.counters.append(counter)
+    return counter
+
+def pop_counter(counter):
+    active.counters.remove(counter)
+
+def budget_message(name, limit, counter):
+    return "{} ran {} SQL statements, over its budget of {}:\n  {}".format(
+        name, counter.count, limit, "\n  ".join(counter.statements))
+
+"""
+query_budget(limit, name, mode)
+    a context manager that fails (mode "raise") or warns (mode "warn")
+    when the block runs more than `limit` SQL statements
+"""
+@contextmanager
+def query_budget(limit, name="block", mode="raise"):
+    counter = push_counter()
+    try:
+        yield counter
+    finally:
+        pop_counter(counter)
+    if counter.count > limit:
+        report_overrun(budget_message(name, limit, counter), mode)
+
+def report_overrun(message, mode):
+    if mode == "raise":
+        raise QueryBudgetExceeded(message)
+    warnings.warn(message, RuntimeWarning)
+
+"""
+QueryBudget
+    per-endpoint query budgets enforced on every request. The
+    QUERY_BUDGET_MODE config picks "raise", "warn" or "off", defaulting
+    to raise under TESTING, warn under DEBUG and off otherwise. When
+    enabled, responses carry an X-Query-Count header.
+"""
+class QueryBudget:
+
+    def __init__(self, budgets):
+        self.budgets = budgets
+        self.mode = "off"
+
+    def init_app(self, app):
+        default = "raise" if app.testing else "warn" if app.debug else "off"
+        self.mode = app.config.get("QUERY_BUDGET_MODE", default)
+        self.budgets = dict(self.budgets, **app.config.get("QUERY_BUDGETS", {}))
+        if self.mode == "off":
+            return
+        self.logger = app.logger
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.teardown_request)
+
+    def start_request(self):
+        g.query_counter = push_counter()
+
+    def finish_request(self, response):
+        counter = g.pop("query_counter", None)
+        if counter is None:
+            return response
+        pop_counter(counter)
+        response.headers[QUERY_COUNT_HEADER] = str(counter.count)
+        limit = self.budgets.get(request.endpoint)
+        if limit is not None and counter.count > limit:
+            message = budget_message(request.endpoint, limit, counter)
+            self.logger.warning(message)
+            report_overrun(message, self.mode)
+        return response
+
+    def teardown_request(self, error=None):
+        counter = g.pop("query_counter", None)
+        if counter is not None:
+            pop_counter(counter)
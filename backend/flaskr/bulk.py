@@ -0,0 +1,139 @@
+import csv
+import io
+import json
+from models import db, Question
+
+IMPORT_BATCH_SIZE = 500
+MAX_IMPORT_BATCH_SIZE = 10000
+MAX_REPORTED_ERRORS = 1000
+IMPORT_FIELDS = ["question", "answer", "difficulty", "category"]
+
+"""
+validate_question(row, categories)
+    checks one imported row and returns (mapping, None) ready for
+    insertion, or (None, message) describing the first problem found
+"""
+def validate_question(row, categories):
+    if not isinstance(row, dict):
+        return None, "row is not an object"
+    for field in IMPORT_FIELDS:
+        if row.get(field) in (None, ""):
+            return None, "missing {}".format(field)
+    try:
+        difficulty = int(row["difficulty"])
+        category = int(row["category"])
+    except (TypeError, ValueError):
+        return None, "difficulty and category must be integers"
+    if category not in categories:
+        return None, "unknown category {}".format(category)
+    return {
+        "question": str(row["question"]),
+        "answer": str(row["answer"]),
+        "difficulty": difficulty,
+        "category": category
+    }, None
+
+"""
+decode_lines(stream, invalid)
+    decodes a binary stream as UTF-8 one line at a time. A line that is
+    not valid UTF-8 is decoded with replacement characters and appended
+    to `invalid`, so the caller can reject the row it belongs to.
+"""
+def decode_lines(stream, invalid):
+    for line in stream:
+        try:
+            yield line.decode("utf-8")
+        except UnicodeDecodeError:
+            invalid.append(line)
+            yield line.decode("utf-8", "replace")
+
+"""
+read_rows(stream, format)
+    reads a binary stream of NDJSON or CSV one line at a time and
+    yields (row number, row, parse error or None)
+"""
+def read_rows(stream, format):
+    invalid = []
+    lines = decode_lines(stream, invalid)
+    if format == "csv":
+        rows = enumerate(csv.DictReader(lines), start=1)
+    else:
+        rows = enumerate(lines, start=1)
+    for index, row in rows:
+        if invalid:
+            del invalid[:]
+            yield index, None, "invalid utf-8"
+            continue
+        if format == "csv":
+            yield index, row, None
+            continue
+        if not row.strip():
+            continue
+        try:
+            yield index, json.loads(row), None
+        except ValueError as error:
+            yield index, None, "invalid json: {}".format(error)
+
+"""
+import_questions(stream, format, categories, batch_size)
+    validates rows as they are read and inserts them in batches of
+    batch_size, one commit per batch. Returns the number imported, the
+    number rejected and the first MAX_REPORTED_ERRORS row errors.
+"""
+def import_questions(stream, format, categories, batch_size=IMPORT_BATCH_SIZE):
+    imported = 0
+    errors = []
+    error_count = 0
+    batch = []
+    for index, row, error in read_rows(stream, format):
+        if error is None:
+            mapping, error = validate_question(row, categories)
+        if error is not None:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"row": index, "error": error})
+            continue
+        batch.append(mapping)
+        if len(batch) >= batch_size:
+            Question.bulk_insert(batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        Question.bulk_insert(batch)
+        imported += len(batch)
+    return {
+        "imported": imported,
+        "rejected": error_count,
+        "errors": errors
+    }
+
+EXPORT_FIELDS = ["id", "question", "answer", "difficulty", "category"]
+EXPORT_CHUNK_SIZE = 1000
+
+"""
+export_questions(format, category_id)
+    yields the question bank as NDJSON or CSV lines, optionally for one
+    category. Rows are read as plain tuples through a server-side
+    cursor in chunks of EXPORT_CHUNK_SIZE, so memory use stays flat.
+"""
+def export_questions(format, category_id=None):
+    selection = db.session.query(
+        Question.id, Question.question, Question.answer,
+        Question.difficulty, Question.category)
+    if category_id is not None:
+        selection = selection.filter(Question.category == category_id)
+    selection = selection.order_by(Question.id).execution_options(
+        stream_results=True).yield_per(EXPORT_CHUNK_SIZE)
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        for row in selection:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+        return
+    for row in selection:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row))) + "\n"
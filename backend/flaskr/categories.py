@@ -0,0 +1,48 @@
+import threading
+import time
+from models import Category
+
+CATEGORY_CACHE_TTL = 300
+
+"""
+CategoryCache
+    holds the prebuilt {id: type} mapping of all categories for `ttl`
+    seconds. Category writes call invalidate() through the category
+    listener hook; hits and misses are counted for monitoring.
+"""
+class CategoryCache:
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self.categories = None
+        self.expires = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.categories is not None and time.monotonic() < self.expires:
+                self.hits += 1
+                return self.categories
+            self.misses += 1
+        fetch_categories = Category.query.order_by(Category.id).all()
+        categories = dict((category.id, category.type)
+                          for category in fetch_categories)
+        with self.lock:
+            self.categories = categories
+            self.expires = time.monotonic() + self.ttl
+        return categories
+
+    def invalidate(self, *args):
+        with self.lock:
+            self.categories = None
+            self.expires = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.categories or {})
+            }
@@ -0,0 +1,155 @@
+import threading
+import time
+from flask import g, request, has_request_context, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+"""
+start_statement / record_statement
+    SQLAlchemy engine events that count the statements of a request and
+    their total time. They are registered once per process and only
+    record while a request is being measured.
+"""
+def start_statement(conn, cursor, statement, parameters, context,
+                    executemany):
+    if has_request_context() and "metrics_start" in g:
+        conn.info.setdefault("metrics_statement_start", []).append(
+            time.perf_counter())
+
+def record_statement(conn, cursor, statement, parameters, context,
+                     executemany):
+    starts = conn.info.get("metrics_statement_start")
+    if not starts or not has_request_context() or "metrics_start" not in g:
+        return
+    g.metrics_sql_count += 1
+    g.metrics_sql_time += time.perf_counter() - starts.pop()
+
+statement_events = {"registered": False}
+
+def register_statement_events():
+    if statement_events["registered"]:
+        return
+    event.listen(Engine, "before_cursor_execute", start_statement)
+    event.listen(Engine, "after_cursor_execute", record_statement)
+    statement_events["registered"] = True
+
+"""
+Metrics
+    per route, method and status: request count, a latency histogram,
+    response bytes, and the number and total time of SQL statements.
+    Extra samples, such as cache and pool statistics, come from
+    collectors added with add_collector(). render() writes everything
+    in the Prometheus text format.
+"""
+class Metrics:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.series = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        register_statement_events()
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql_count = 0
+        g.metrics_sql_time = 0.0
+
+    def finish_request(self, response):
+        if "metrics_start" not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_start
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        key = (route, request.method, str(response.status_code))
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {
+                    "count": 0,
+                    "latency_buckets": [0] * len(self.buckets),
+                    "latency_sum": 0.0,
+                    "response_bytes": 0,
+                    "sql_statements": 0,
+                    "sql_time": 0.0
+                }
+            series["count"] += 1
+            series["latency_sum"] += elapsed
+            for index, bound in enumerate(self.buckets):
+                if elapsed <= bound:
+                    series["latency_buckets"][index] += 1
+            series["response_bytes"] += response.content_length or 0
+            series["sql_statements"] += g.metrics_sql_count
+            series["sql_time"] += g.metrics_sql_time
+        return response
+
+    """
+    add_collector(name, help, collect)
+        collect() returns a dict of statistics; each numeric one is
+        written as a gauge sample of `name` labelled with its key
+    """
+    def add_collector(self, name, help, collect):
+        self.collectors.append((name, help, collect))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            series = sorted(self.series.items())
+
+        def family(name, help, type):
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} {}".format(name, type))
+
+        def labels(key, extra=""):
+            route, method, status = key
+            return '{{route="{}",method="{}",status="{}"{}}}'.format(
+                route, method, status, extra)
+
+        family("trivia_requests_total", "Requests handled.", "counter")
+        for key, values in series:
+            lines.append("trivia_requests_total{} {}".format(
+                labels(key), values["count"]))
+        family("trivia_request_duration_seconds", "Request latency.",
+               "histogram")
+        for key, values in series:
+            for bound, count in zip(self.buckets, values["latency_buckets"]):
+                lines.append("trivia_request_duration_seconds_bucket{} {}"
+                             .format(labels(key, ',le="{}"'.format(bound)),
+                                     count))
+            lines.append("trivia_request_duration_seconds_bucket{} {}".format(
+                labels(key, ',le="+Inf"'), values["count"]))
+            lines.append("trivia_request_duration_seconds_sum{} {}".format(
+                labels(key), values["latency_sum"]))
+            lines.append("trivia_request_duration_seconds_count{} {}".format(
+                labels(key), values["count"]))
+        family("trivia_response_bytes_total", "Response body bytes.",
+               "counter")
+        for key, values in series:
+            lines.append("trivia_response_bytes_total{} {}".format(
+                labels(key), values["response_bytes"]))
+        family("trivia_sql_statements_total", "SQL statements executed.",
+               "counter")
+        for key, values in series:
+            lines.append("trivia_sql_statements_total{} {}".format(
+                labels(key), values["sql_statements"]))
+        family("trivia_sql_duration_seconds_total",
+               "Time spent executing SQL statements.", "counter")
+        for key, values in series:
+            lines.append("trivia_sql_duration_seconds_total{} {}".format(
+                labels(key), values["sql_time"]))
+        for name, help, collect in self.collectors:
+            family(name, help, "gauge")
+            for sample, value in sorted(collect().items()):
+                if isinstance(value, (int, float)):
+                    lines.append('{}{{stat="{}"}} {}'.format(
+                        name, sample, value))
+        return "\n".join(lines) + "\n"
+
+    def response(self):
+        return Response(self.render(), mimetype=PROMETHEUS_MIMETYPE)
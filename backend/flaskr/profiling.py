@@ -0,0 +1,105 @@
+import cProfile
+import hmac
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from flask import g, request
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_DIR = "profiles"
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_INTERVAL = 0.001
+
+"""
+StackSampler
+    samples the stack of one thread every `interval` seconds and counts
+    each distinct stack, for a collapsed-stack flamegraph file
+"""
+class StackSampler(threading.Thread):
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("{} ({}:{})".format(
+                    code.co_name, os.path.basename(code.co_filename),
+                    code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, "w") as output:
+            for stack, count in self.stacks.most_common():
+                output.write("{} {}\n".format(stack, count))
+
+"""
+RequestProfiler
+    runs selected requests under cProfile and a stack sampler, then
+    writes <route>-<time>-<pid>-<sequence>.pstats and .collapsed files
+    to PROFILE_DIR. A request is selected when it sends PROFILE_HEADER
+    with the configured PROFILE_TOKEN, or at random with probability
+    PROFILE_SAMPLE_RATE. Nothing is registered unless PROFILING_ENABLED
+    is set, and unselected requests only pay for that check.
+"""
+class RequestProfiler:
+
+    def init_app(self, app):
+        if not app.config.get("PROFILING_ENABLED", False):
+            return
+        self.token = app.config.get("PROFILE_TOKEN")
+        self.sample_rate = app.config.get(
+            "PROFILE_SAMPLE_RATE", PROFILE_SAMPLE_RATE)
+        self.directory = app.config.get("PROFILE_DIR", PROFILE_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self.sequence = itertools.count(1)
+        app.before_request(self.start_request)
+        app.teardown_request(self.finish_request)
+
+    def selected(self):
+        header = request.headers.get(PROFILE_HEADER)
+        if header is not None and self.token:
+            return hmac.compare_digest(header.encode("utf-8"),
+                                       self.token.encode("utf-8"))
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start_request(self):
+        if not self.selected():
+            return
+        g.profile_sampler = StackSampler(threading.get_ident())
+        g.profile_sampler.start()
+        g.profile = cProfile.Profile()
+        g.profile.enable()
+
+    def finish_request(self, error=None):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return
+        profile.disable()
+        sampler = g.pop("profile_sampler")
+        sampler.stop()
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        tag = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        base = os.path.join(self.directory, "{}-{}-{}-{}".format(
+            tag, time.strftime("%Y%m%dT%H%M%S"), os.getpid(),
+            next(self.sequence)))
+        profile.dump_stats(base + ".pstats")
+        sampler.write(base + ".collapsed")
@@ -0,0 +1,294 @@
+import random
+import secrets
+import threading
+import time
+from array import array
+from itsdangerous import BadData, URLSafeTimedSerializer
+from models import db, Question
+
+QUIZ_POOL_TTL = 300
+SAMPLE_ATTEMPTS = 8
+MAX_QUIZ_BATCH = 50
+
+"""
+IdPool
+    a list of question ids with O(1) add, remove and random choice
+"""
+class IdPool:
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, question_id):
+        return question_id in self.positions
+
+    def add(self, question_id):
+        if question_id in self.positions:
+            return
+        self.positions[question_id] = len(self.ids)
+        self.ids.append(question_id)
+
+    def remove(self, question_id):
+        position = self.positions.pop(question_id, None)
+        if position is None:
+            return
+        last_id = self.ids.pop()
+        if last_id != question_id:
+            self.ids[position] = last_id
+            self.positions[last_id] = position
+
+    def choice(self):
+        return self.ids[random.randrange(0, len(self.ids))]
+
+"""
+QuizSelector
+    picks a random unseen question for a quiz category from per-category
+    id pools, without loading the candidate questions from the database.
+    Category 0 means all categories. The pools are rebuilt from the
+    question ids every `ttl` seconds to pick up writes from other workers,
+    by one request while the others keep using the old pools.
+    `snapshot` returns the shared question snapshot, or None, to read
+    pools and questions from instead of the database.
+"""
+class QuizSelector:
+
+    def __init__(self, ttl=QUIZ_POOL_TTL, snapshot=None):
+        self.ttl = ttl
+        self.snapshot = snapshot
+        self.pools = {}
+        self.ordered = {}
+        self.expires = 0
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+
+    def open_snapshot(self):
+        if self.snapshot is None:
+            return None
+        return self.snapshot()
+
+    def refresh(self):
+        snapshot = self.open_snapshot()
+        if snapshot is not None:
+            self.load(snapshot.id_rows())
+            return
+        fetch_ids = db.session.query(Question.id, Question.category)
+        self.load(fetch_ids.yield_per(1000))
+
+    def load(self, rows):
+        pools = {0: IdPool()}
+        for question_id, category in rows:
+            pools[0].add(question_id)
+            pools.setdefault(normalize_id(category), IdPool()).add(
+                question_id)
+        ordered = dict((category, array("q", sorted(pool.ids)))
+                       for category, pool in pools.items())
+        with self.lock:
+            self.pools = pools
+            self.ordered = ordered
+            self.expires = time.monotonic() + self.ttl
+
+    """
+    ensure_fresh()
+        reloads the pools once they expire. Only one thread reloads;
+        the others keep serving the old pools meanwhile, and only wait
+        when there are no pools yet.
+    """
+    def ensure_fresh(self):
+        if time.monotonic() < self.expires:
+            return
+        if not self.refresh_lock.acquire(blocking=not self.pools):
+            return
+        try:
+            if time.monotonic() >= self.expires:
+                self.refresh()
+        finally:
+            self.refresh_lock.release()
+
+    def pool(self, category_id):
+        self.ensure_fresh()
+        return self.pools.get(normalize_id(category_id), IdPool())
+
+    """
+    ordered_ids(category_id)
+        the ids of a category as of the last reload, in ascending order.
+        The list only changes on reload: deleted ids stay in it until
+        then, so positions in it are stable, and new questions, whose
+        ids are higher, are appended.
+    """
+    def ordered_ids(self, category_id):
+        self.pool(category_id)
+        return self.ordered.get(normalize_id(category_id), array("q"))
+
+    def next_question_id(self, category_id, previous_questions):
+        pool = self.pool(category_id)
+        seen = set(normalize_id(question_id)
+                   for question_id in previous_questions or [])
+        with self.lock:
+            if len(pool) > 2 * len(seen):
+                for attempt in range(SAMPLE_ATTEMPTS):
+                    question_id = pool.choice()
+                    if question_id not in seen:
+                        return question_id
+            remaining = [question_id for question_id in pool.ids
+                         if question_id not in seen]
+        if len(remaining) == 0:
+            return None
+        return random.choice(remaining)
+
+    def next_question(self, category_id, previous_questions):
+        while True:
+            question_id = self.next_question_id(category_id, previous_questions)
+            if question_id is None:
+                return None
+            question = self.fetch([question_id]).get(question_id)
+            if question is not None:
+                return question
+            self.discard(question_id)
+
+    def next_questions(self, category_id, previous_questions, count):
+        seen = set(normalize_id(question_id)
+                   for question_id in previous_questions or [])
+        question_ids = []
+        while len(question_ids) < count:
+            question_id = self.next_question_id(category_id, seen)
+            if question_id is None:
+                break
+            seen.add(question_id)
+            question_ids.append(question_id)
+        if len(question_ids) == 0:
+            return []
+        by_id = self.fetch(question_ids)
+        for question_id in question_ids:
+            if question_id not in by_id:
+                self.discard(question_id)
+        return [by_id[question_id] for question_id in question_ids
+                if question_id in by_id]
+
+    """
+    fetch(question_ids)
+        the questions with the given ids by id, from the snapshot when
+        it is available; ids it does not hold yet, such as questions
+        inserted since it was built, are loaded from the database
+    """
+    def fetch(self, question_ids):
+        by_id = {}
+        snapshot = self.open_snapshot()
+        if snapshot is not None:
+            for question_id in question_ids:
+                question = snapshot.get(question_id)
+                if question is not None:
+                    by_id[question_id] = question
+        missing_ids = [question_id for question_id in question_ids
+                       if question_id not in by_id]
+        if missing_ids:
+            for question in Question.query.filter(
+                    Question.id.in_(missing_ids)):
+                by_id[question.id] = question
+        return by_id
+
+    def discard(self, question_id):
+        with self.lock:
+            for pool in self.pools.values():
+                pool.remove(question_id)
+
+    def question_changed(self, event, question):
+        if event == "reset":
+            self.expires = 0
+        elif event == "delete":
+            self.discard(question.id)
+        elif event in ("insert", "update") and self.pools:
+            if event == "update":
+                self.discard(question.id)
+            with self.lock:
+                self.pools[0].add(question.id)
+                self.pools.setdefault(normalize_id(question.category),
+                                      IdPool()).add(question.id)
+
+def normalize_id(category):
+    try:
+        return int(category)
+    except (TypeError, ValueError):
+        return category
+
+QUIZ_SESSION_TTL = 1800
+
+"""
+permute(index, bits, seed)
+    a bijection of [0, 4 ** ((bits + 1) // 2)) chosen by `seed`: a
+    four round Feistel network over the two halves of `index`
+"""
+def permute(index, bits, seed):
+    half = (bits + 1) // 2
+    mask = (1 << half) - 1
+    left, right = index >> half, index & mask
+    for round in range(4):
+        key = (seed * (2 * round + 1) * 0x9E3779B1) & 0xFFFFFFFF
+        mixed = ((right ^ key) * 0x45D9F3B) & 0xFFFFFFFF
+        mixed ^= mixed >> 16
+        left, right = right, left ^ (mixed & mask)
+    return left << half | right
+
+"""
+QuizSessions
+    quiz sessions without server-side state, so clients send a token
+    instead of the whole previous_questions list and any worker can
+    serve it. The token is signed with `secret_key` and holds the quiz
+    category, how many questions it had when the session started, a
+    random seed, a cursor and the number of questions not yet visited.
+    The seed picks a permutation of the positions in the category's
+    ordered ids; each question walks the cursor past the positions whose
+    question has since been deleted or moved and comes with the token
+    for the next one, so no question is served twice, questions added
+    later are left out and a round takes a few steps however large
+    the bank is. Tokens expire `ttl` seconds after they were issued.
+    Without a `secret_key`, tokens only work in the worker that issued
+    them.
+"""
+class QuizSessions:
+
+    def __init__(self, selector, secret_key=None, ttl=QUIZ_SESSION_TTL):
+        self.selector = selector
+        self.ttl = ttl
+        self.serializer = URLSafeTimedSerializer(
+            secret_key or secrets.token_hex(32), salt="quiz-session")
+
+    def start(self, category_id):
+        category_id = normalize_id(category_id)
+        count = len(self.selector.ordered_ids(category_id))
+        return self.serializer.dumps(
+            [category_id, count, secrets.randbits(32), 0, count])
+
+    """
+    next_question(token)
+        the next question of the session and the token for the one
+        after it; raises KeyError for a token that is forged, malformed
+        or expired
+    """
+    def next_question(self, token):
+        try:
+            category_id, count, seed, cursor, remaining = \
+                self.serializer.loads(token, max_age=self.ttl)
+        except (BadData, TypeError, ValueError):
+            raise KeyError(token)
+        pool = self.selector.pool(category_id)
+        ordered = self.selector.ordered_ids(category_id)
+        bits = max(count - 1, 1).bit_length()
+        question = None
+        while question is None and remaining > 0:
+            position = permute(cursor, bits, seed)
+            cursor += 1
+            if position >= count:
+                continue
+            remaining -= 1
+            if position >= len(ordered) or ordered[position] not in pool:
+                continue
+            question_id = ordered[position]
+            question = self.selector.fetch([question_id]).get(question_id)
+            if question is None:
+                self.selector.discard(question_id)
+        return question, self.serializer.dumps(
+            [category_id, count, seed, cursor, remaining])
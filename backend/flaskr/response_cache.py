@@ -0,0 +1,105 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response, Response
+from .routing import recently_wrote
+
+RESPONSE_CACHE_TTL = 300
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_MAX_AGE = 0
+
+"""
+ResponseCache
+    caches the encoded body of successful GET responses by path and
+    query string, with a strong ETag. Entries are dropped when the data
+    version is bumped (on every question or category write) or after
+    `ttl` seconds, which bounds staleness across workers. Clients pinned
+    to the primary after a write bypass the cache, so they read their
+    own writes even from a worker that has not seen them.
+"""
+class ResponseCache:
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, size=RESPONSE_CACHE_SIZE,
+                 max_age=RESPONSE_CACHE_MAX_AGE):
+        self.ttl = ttl
+        self.size = size
+        self.max_age = max_age
+        self.version = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+    def bump(self, *args):
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry["version"] != self.version or \
+                    time.monotonic() >= entry["expires"]:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def store(self, key, version, response):
+        body = response.get_data()
+        entry = {
+            "version": version,
+            "expires": time.monotonic() + self.ttl,
+            "body": body,
+            "etag": hashlib.sha1(body).hexdigest(),
+            "mimetype": response.mimetype
+        }
+        with self.lock:
+            if version == self.version:
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return entry
+
+    def respond(self, entry):
+        if request.if_none_match.contains(entry["etag"]):
+            with self.lock:
+                self.not_modified += 1
+            response = Response(status=304)
+        else:
+            response = Response(entry["body"], mimetype=entry["mimetype"])
+        response.set_etag(entry["etag"])
+        response.headers["Cache-Control"] = \
+            "public, max-age={}, must-revalidate".format(self.max_age)
+        return response
+
+    def cached(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if recently_wrote():
+                return view(*args, **kwargs)
+            key = (request.path, request.query_string)
+            entry = self.lookup(key)
+            if entry is None:
+                version = self.version
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = self.store(key, version, response)
+            return self.respond(entry)
+        return wrapper
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "size": len(self.entries),
+                "version": self.version
+            }
@@ -0,0 +1,39 @@
+import time
+from functools import wraps
+from flask import g, request
+from models import choose_replica
+
+PRIMARY_COOKIE = "trivia_primary_until"
+
+"""
+read_only(view)
+    marks a handler as read-only so its queries may be served by a read
+    replica. Clients that wrote within the last
+    DB_PRIMARY_STICKY_SECONDS keep reading from the primary, so they see
+    their own writes.
+"""
+def read_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        if not recently_wrote():
+            g.db_replica = choose_replica()
+        return view(*args, **kwargs)
+    return wrapper
+
+def recently_wrote():
+    primary_until = request.cookies.get(PRIMARY_COOKIE, 0, type=float)
+    return time.time() < primary_until
+
+"""
+mark_recent_write(response, sticky_seconds)
+    after a successful write, pins the client to the primary
+    for sticky_seconds
+"""
+def mark_recent_write(response, sticky_seconds):
+    if request.method in ("POST", "PUT", "PATCH", "DELETE") and \
+            not g.get("read_only") and response.status_code < 400 and \
+            sticky_seconds > 0:
+        response.set_cookie(PRIMARY_COOKIE, str(time.time() + sticky_seconds),
+                            max_age=sticky_seconds, httponly=True)
+    return response
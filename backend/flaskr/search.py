@@ -0,0 +1,209 @@
+import threading
+import time
+from flask import current_app
+from sqlalchemy import func, or_, text
+from models import db, Question
+from .serialization import QUESTION_COLUMNS
+
+SEARCH_INDEX_TTL = 300
+
+"""
+search backends
+    both return (rows, total) for the questions whose text contains
+    the search term (case-insensitively), best matches first, with only
+    the requested page loaded from the database as QUESTION_COLUMNS
+    row tuples.
+"""
+
+"""
+TrigramSearch
+    Postgres backend: ILIKE on columns covered by pg_trgm GIN indexes,
+    ranked by trigram similarity. The indexes are created by
+    `flask init-db`; the first search checks that pg_trgm is installed
+    and otherwise hands every search to the in-process `fallback`.
+"""
+class TrigramSearch:
+
+    name = "trigram"
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+        self.available = None
+
+    def create_indexes(self):
+        db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_questions_question_trgm "
+            "ON questions USING gin (question gin_trgm_ops)"))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_questions_answer_trgm "
+            "ON questions USING gin (answer gin_trgm_ops)"))
+        db.session.commit()
+        self.available = True
+
+    def is_available(self):
+        if self.available is None:
+            self.available = db.session.execute(text(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )).scalar() is not None
+            if not self.available:
+                current_app.logger.warning(
+                    "pg_trgm is not installed, using the in-process search "
+                    "index; run flask init-db to create it")
+        return self.available
+
+    def search(self, search_term, include_answers, offset, limit):
+        if not self.is_available():
+            return self.fallback.search(
+                search_term, include_answers, offset, limit)
+        find_word = Question.question.ilike(f'%{search_term}%')
+        rank = func.similarity(Question.question, search_term)
+        if include_answers:
+            find_word = or_(find_word,
+                            Question.answer.ilike(f'%{search_term}%'))
+            rank = func.greatest(
+                rank, func.similarity(Question.answer, search_term))
+        total = db.session.query(func.count(Question.id)).filter(
+            find_word).scalar()
+        fetch_questions = db.session.query(*QUESTION_COLUMNS).filter(
+            find_word).order_by(rank.desc(), Question.id).limit(
+            limit).offset(offset).all()
+        return fetch_questions, total
+
+    def question_changed(self, event, question):
+        self.fallback.question_changed(event, question)
+
+"""
+InvertedIndexSearch
+    in-process backend for SQLite and test runs: a trigram inverted
+    index over question and answer text, kept current on insert and
+    delete. Candidates from the posting lists are verified as
+    substrings and ranked whole word, then word prefix, then any
+    substring, ties broken by id.
+"""
+class InvertedIndexSearch:
+
+    name = "memory"
+
+    def __init__(self, ttl=SEARCH_INDEX_TTL):
+        self.ttl = ttl
+        self.texts = {}
+        self.postings = {"question": {}, "answer": {}}
+        self.expires = 0
+        self.lock = threading.Lock()
+
+    def create_indexes(self):
+        pass
+
+    def refresh(self):
+        fetch_texts = db.session.query(
+            Question.id, Question.question, Question.answer)
+        with self.lock:
+            self.texts = {}
+            self.postings = {"question": {}, "answer": {}}
+            for question_id, question, answer in fetch_texts.yield_per(1000):
+                self.add(question_id, question, answer)
+            self.expires = time.monotonic() + self.ttl
+
+    def add(self, question_id, question, answer):
+        fields = {"question": (question or "").lower(),
+                  "answer": (answer or "").lower()}
+        self.texts[question_id] = fields
+        for field, value in fields.items():
+            for gram in trigrams(value):
+                self.postings[field].setdefault(gram, set()).add(question_id)
+
+    def remove(self, question_id):
+        fields = self.texts.pop(question_id, None)
+        if fields is None:
+            return
+        for field, value in fields.items():
+            for gram in trigrams(value):
+                posting = self.postings[field].get(gram)
+                if posting is not None:
+                    posting.discard(question_id)
+                    if not posting:
+                        del self.postings[field][gram]
+
+    def candidates(self, field, search_term):
+        grams = trigrams(search_term)
+        if not grams:
+            return set(self.texts)
+        postings = [self.postings[field].get(gram, set()) for gram in grams]
+        postings.sort(key=len)
+        found = set(postings[0])
+        for posting in postings[1:]:
+            found &= posting
+        return found
+
+    def search(self, search_term, include_answers, offset, limit):
+        if time.monotonic() >= self.expires:
+            self.refresh()
+        search_term = search_term.lower()
+        fields = ["question", "answer"] if include_answers else ["question"]
+        ranked = []
+        with self.lock:
+            for field in fields:
+                for question_id in self.candidates(field, search_term):
+                    rank = match_rank(self.texts[question_id][field],
+                                      search_term)
+                    if rank is not None:
+                        ranked.append((rank, question_id))
+        best = {}
+        for rank, question_id in ranked:
+            best[question_id] = min(rank, best.get(question_id, rank))
+        order = sorted(best, key=lambda question_id:
+                       (best[question_id], question_id))
+        page_ids = order[offset:offset + limit]
+        if not page_ids:
+            return [], len(order)
+        fetch_questions = db.session.query(*QUESTION_COLUMNS).filter(
+            Question.id.in_(page_ids)).all()
+        by_id = dict((question.id, question) for question in fetch_questions)
+        return [by_id[question_id] for question_id in page_ids
+                if question_id in by_id], len(order)
+
+    def question_changed(self, event, question):
+        if event == "reset":
+            self.expires = 0
+            return
+        with self.lock:
+            if not self.expires:
+                return
+            if event in ("update", "delete"):
+                self.remove(question.id)
+            if event in ("insert", "update"):
+                self.add(question.id, question.question, question.answer)
+
+def trigrams(value):
+    return set(value[index:index + 3] for index in range(len(value) - 2))
+
+def match_rank(value, search_term):
+    position = value.find(search_term)
+    if position < 0:
+        return None
+    words = value.split()
+    stripped = [word.strip(".,;:!?'\"()") for word in words]
+    if search_term in stripped:
+        return 0
+    if any(word.startswith(search_term) for word in stripped):
+        return 1
+    return 2
+
+"""
+create_search_backend(app)
+    picks the backend from SEARCH_BACKEND ("trigram" or "memory"),
+    defaulting to trigram on Postgres and memory elsewhere
+"""
+def create_search_backend(app):
+    name = app.config.get("SEARCH_BACKEND")
+    if name is None:
+        name = "trigram" if app.config["SQLALCHEMY_DATABASE_URI"].startswith(
+            "postgresql") else "memory"
+    memory_search = InvertedIndexSearch(
+        app.config.get("SEARCH_INDEX_TTL", SEARCH_INDEX_TTL))
+    if name == "trigram":
+        return TrigramSearch(memory_search)
+    if name == "memory":
+        return memory_search
+    raise ValueError("unknown search backend: {}".format(name))
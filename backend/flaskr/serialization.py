@@ -0,0 +1,102 @@
+import json
+import threading
+from collections import OrderedDict
+from flask import Response, current_app
+from models import Question
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FRAGMENT_CACHE_SIZE = 100000
+
+"""
+the question columns loaded as plain row tuples on read-only paths,
+in the order of the keys of Question.format()
+"""
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer,
+                    Question.category, Question.difficulty)
+QUESTION_FIELDS = ("id", "question", "answer", "category", "difficulty")
+
+"""
+dumps(value)
+    compact JSON as bytes, with orjson when it is installed
+"""
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+"""
+FragmentCache
+    the encoded JSON of recently served questions, keyed by id. Each
+    entry keeps the row it was encoded from and is only reused for an
+    identical row, so fragments never go stale; question update and
+    delete events also drop entries to free memory early.
+"""
+class FragmentCache:
+
+    def __init__(self, size=FRAGMENT_CACHE_SIZE):
+        self.size = size
+        self.fragments = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def encode(self, row):
+        row = tuple(row)
+        with self.lock:
+            entry = self.fragments.get(row[0])
+            if entry is not None and entry[0] == row:
+                self.fragments.move_to_end(row[0])
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        fragment = dumps(dict(zip(QUESTION_FIELDS, row)))
+        with self.lock:
+            self.fragments[row[0]] = (row, fragment)
+            self.fragments.move_to_end(row[0])
+            while len(self.fragments) > self.size:
+                self.fragments.popitem(last=False)
+        return fragment
+
+    def encode_all(self, rows):
+        return [self.encode(row) for row in rows]
+
+    def question_changed(self, event, question):
+        with self.lock:
+            if event == "reset":
+                self.fragments.clear()
+            elif event in ("update", "delete"):
+                self.fragments.pop(question.id, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.fragments)
+            }
+
+"""
+encode_questions(rows)
+    the encoded JSON fragments of question rows, through the current
+    app's fragment cache
+"""
+def encode_questions(rows):
+    return current_app.extensions["question_fragments"].encode_all(rows)
+
+"""
+json_response(payload, questions)
+    a JSON response of the payload with a "questions" list assembled
+    from pre-encoded question fragments
+"""
+def json_response(payload, questions):
+    body = dumps(payload)
+    questions_body = b'"questions":[' + b",".join(questions) + b"]"
+    if body == b"{}":
+        body = b"{" + questions_body + b"}"
+    else:
+        body = b"{" + questions_body + b"," + body[1:]
+    return Response(body + b"\n", mimetype="application/json")
@@ -0,0 +1,372 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from collections import namedtuple
+from contextlib import contextmanager
+from flask import current_app, has_request_context
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Question, Category
+from .serialization import QUESTION_COLUMNS, QUESTION_FIELDS
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SNAPSHOT_MAGIC = b"TRIVSNP1"
+SNAPSHOT_RETRY = 60
+SNAPSHOT_MAX_AGE = 300
+NULL = -1
+
+"""
+the snapshot header: magic, then the number of questions, categories
+and categorised questions and the size of the string heap
+"""
+HEADER = struct.Struct("=8s4I")
+
+"""
+SnapshotQuestion
+    a question read from a snapshot, a row tuple in the order of
+    QUESTION_COLUMNS that can also be formatted like a Question
+"""
+class SnapshotQuestion(namedtuple("SnapshotQuestion", QUESTION_FIELDS)):
+
+    __slots__ = ()
+
+    def format(self):
+        return dict(zip(self._fields, self))
+
+def nullable(value):
+    return NULL if value is None else value
+
+"""
+build_snapshot(path)
+    writes the questions and categories tables to a snapshot file at
+    `path`. The file holds, after the header, packed native int32
+    arrays: question ids (ascending), categories and difficulties, the
+    heap offsets of each question and answer text, category ids, the
+    heap offsets of their types and their ranges in the row indices of
+    the questions grouped by category; then the UTF-8 string heap. It
+    is written to a temporary file and renamed over `path`, so readers
+    only ever map a complete snapshot.
+"""
+def build_snapshot(path):
+    ids, categories, difficulties = array("i"), array("i"), array("i")
+    texts = array("I", [0])
+    heap = bytearray()
+    members = {}
+    fetch_questions = db.session.query(*QUESTION_COLUMNS).order_by(
+        Question.id).yield_per(1000)
+    for position, (question_id, question, answer, category,
+                   difficulty) in enumerate(fetch_questions):
+        ids.append(question_id)
+        categories.append(nullable(category))
+        difficulties.append(nullable(difficulty))
+        heap += (question or "").encode("utf-8")
+        texts.append(len(heap))
+        heap += (answer or "").encode("utf-8")
+        texts.append(len(heap))
+        if category is not None:
+            members.setdefault(category, array("i")).append(position)
+
+    category_ids, category_texts = array("i"), array("I", [len(heap)])
+    category_ranges, by_category = array("I", [0]), array("i")
+    for category_id, category_type in db.session.query(
+            Category.id, Category.type).order_by(Category.id):
+        category_ids.append(category_id)
+        heap += (category_type or "").encode("utf-8")
+        category_texts.append(len(heap))
+        by_category.extend(members.get(category_id, ()))
+        category_ranges.append(len(by_category))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(
+        dir=directory, prefix=os.path.basename(path) + ".")
+    try:
+        with os.fdopen(handle, "wb") as output:
+            output.write(HEADER.pack(SNAPSHOT_MAGIC, len(ids),
+                                     len(category_ids), len(by_category),
+                                     len(heap)))
+            for section in (ids, categories, difficulties, texts,
+                            category_ids, category_texts, category_ranges,
+                            by_category):
+                output.write(section.tobytes())
+            output.write(heap)
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+    return len(ids)
+
+"""
+build_lock(path)
+    serializes snapshot builds across processes with a lock file next to
+    the snapshot, so a build never replaces a newer one
+"""
+@contextmanager
+def build_lock(path):
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def file_identity(stat):
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+"""
+SnapshotFile
+    a read-only memory map of a snapshot file. The arrays are int32
+    views straight into the mapping, so every worker mapping the same
+    file shares a single page-cache copy; only the strings of the rows
+    actually read are decoded.
+"""
+class SnapshotFile:
+
+    def __init__(self, path):
+        with open(path, "rb") as snapshot_file:
+            stat = os.fstat(snapshot_file.fileno())
+            self.identity = file_identity(stat)
+            self.built = stat.st_mtime
+            self.map = mmap.mmap(snapshot_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        self.size = len(self.map)
+        view = memoryview(self.map)
+        if self.size < HEADER.size:
+            raise ValueError("snapshot {} is truncated".format(path))
+        magic, question_count, category_count, indexed_count, heap_size = \
+            HEADER.unpack_from(self.map)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("{} is not a question snapshot".format(path))
+        offset = HEADER.size
+
+        def section(count, format):
+            nonlocal offset
+            start, offset = offset, offset + 4 * count
+            return view[start:offset].cast(format)
+
+        self.ids = section(question_count, "i")
+        self.categories = section(question_count, "i")
+        self.difficulties = section(question_count, "i")
+        self.texts = section(2 * question_count + 1, "I")
+        self.category_ids = section(category_count, "i")
+        self.category_texts = section(category_count + 1, "I")
+        self.category_ranges = section(category_count + 1, "I")
+        self.by_category = section(indexed_count, "i")
+        self.heap = view[offset:offset + heap_size]
+        if len(self.heap) != heap_size:
+            raise ValueError("snapshot {} is truncated".format(path))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_current(self, path):
+        return file_identity(os.stat(path)) == self.identity
+
+    def age(self):
+        return time.time() - self.built
+
+    def text(self, start, end):
+        return str(self.heap[start:end], "utf-8")
+
+    def question(self, position):
+        category = self.categories[position]
+        difficulty = self.difficulties[position]
+        return SnapshotQuestion(
+            self.ids[position],
+            self.text(self.texts[2 * position], self.texts[2 * position + 1]),
+            self.text(self.texts[2 * position + 1],
+                      self.texts[2 * position + 2]),
+            None if category == NULL else category,
+            None if difficulty == NULL else difficulty)
+
+    def get(self, question_id):
+        position = search_after(self.ids, range(len(self.ids)),
+                                question_id - 1)
+        if position < len(self.ids) and self.ids[position] == question_id:
+            return self.question(position)
+        return None
+
+    def category_position(self, category_id):
+        position = search_after(self.category_ids,
+                                range(len(self.category_ids)),
+                                category_id - 1)
+        if position < len(self.category_ids) and \
+                self.category_ids[position] == category_id:
+            return position
+        return None
+
+    def select(self, category_id=None):
+        if category_id is None:
+            return SnapshotSelection(self, range(len(self.ids)))
+        position = self.category_position(category_id)
+        if position is None:
+            return SnapshotSelection(self, range(0))
+        return SnapshotSelection(self, self.by_category[
+            self.category_ranges[position]:self.category_ranges[position + 1]])
+
+    def categories_by_id(self):
+        return dict(
+            (self.category_ids[position],
+             self.text(self.category_texts[position],
+                       self.category_texts[position + 1]))
+            for position in range(len(self.category_ids)))
+
+    def id_rows(self):
+        for question_id, category in zip(self.ids, self.categories):
+            yield question_id, None if category == NULL else category
+
+"""
+search_after(ids, positions, question_id)
+    the index of the first of `positions` whose id is greater than
+    question_id; positions are in ascending id order
+"""
+def search_after(ids, positions, question_id):
+    low, high = 0, len(positions)
+    while low < high:
+        middle = (low + high) // 2
+        if ids[positions[middle]] <= question_id:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+"""
+SnapshotSelection
+    the questions of a snapshot, or of one of its categories, in id
+    order; paginate_questions and paginate_questions_after read pages
+    from it instead of running a query
+"""
+class SnapshotSelection:
+
+    def __init__(self, snapshot, positions):
+        self.snapshot = snapshot
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def slice(self, offset, limit):
+        return [self.snapshot.question(position)
+                for position in self.positions[offset:offset + limit]]
+
+    def after(self, question_id, limit):
+        start = search_after(self.snapshot.ids, self.positions, question_id)
+        return self.slice(start, limit)
+
+"""
+QuestionSnapshot
+    the shared snapshot of one app, at `path`. open() maps the snapshot
+    file, building it first when it is missing, and remaps it whenever
+    another worker has replaced it. Question and category writes made
+    in a request rebuild it on a background thread; while that runs,
+    open() returns None so this worker reads its own writes from the
+    database. Writes made outside a request, by a CLI command, do not
+    start a thread the command would kill on exit: the command calls
+    rebuild() when it is done. A snapshot older than `max_age` seconds
+    is rebuilt as well, which picks up any write that missed both. A
+    failed build is retried after `retry` seconds.
+"""
+class QuestionSnapshot:
+
+    def __init__(self, path, retry=SNAPSHOT_RETRY, max_age=SNAPSHOT_MAX_AGE):
+        self.path = path
+        self.retry = retry
+        self.max_age = max_age
+        self.current = None
+        self.failed_until = 0
+        self.rebuilds = 0
+        self.remaps = 0
+        self.worker = None
+        self.pending = False
+        self.lock = threading.Lock()
+        self.worker_lock = threading.Lock()
+
+    def open(self):
+        if self.worker is not None or time.monotonic() < self.failed_until:
+            return None
+        current = self.current
+        try:
+            if current is None or not current.is_current(self.path):
+                current = self.load()
+        except (OSError, ValueError, SQLAlchemyError) as error:
+            db.session.rollback()
+            current_app.logger.warning(
+                "question snapshot unavailable, reading from the database: "
+                "%s", error)
+            self.failed_until = time.monotonic() + self.retry
+            return None
+        if current.age() > self.max_age:
+            self.changed("expire", None)
+            return None
+        return current
+
+    def load(self):
+        with self.lock:
+            if not os.path.exists(self.path):
+                self.rebuild()
+            self.current = SnapshotFile(self.path)
+            self.remaps += 1
+            return self.current
+
+    """
+    rebuild(max_age=None)
+        builds the snapshot; with `max_age`, only when the file is older,
+        so workers whose snapshot expired at once build it only once
+    """
+    def rebuild(self, max_age=None):
+        with build_lock(self.path):
+            if max_age is not None and os.path.exists(self.path) and \
+                    time.time() - os.stat(self.path).st_mtime < max_age:
+                return
+            build_snapshot(self.path)
+        self.rebuilds += 1
+
+    def changed(self, event, item):
+        if not has_request_context():
+            return
+        app = current_app._get_current_object()
+        with self.worker_lock:
+            if self.worker is not None:
+                self.pending = True
+                return
+            self.worker = threading.Thread(
+                target=self.rebuild_in_background,
+                args=(app, event == "expire"), daemon=True)
+            self.worker.start()
+
+    def rebuild_in_background(self, app, expired=False):
+        with app.app_context():
+            while True:
+                try:
+                    self.rebuild(self.max_age if expired else None)
+                except (OSError, SQLAlchemyError) as error:
+                    db.session.rollback()
+                    app.logger.warning(
+                        "question snapshot rebuild failed: %s", error)
+                with self.worker_lock:
+                    if not self.pending:
+                        self.worker = None
+                        return
+                    self.pending = False
+                    expired = False
+
+    def stats(self):
+        current = self.current
+        return {
+            "questions": len(current) if current is not None else 0,
+            "bytes": current.size if current is not None else 0,
+            "rebuilds": self.rebuilds,
+            "remaps": self.remaps
+        }
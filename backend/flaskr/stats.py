@@ -0,0 +1,92 @@
+import threading
+import time
+from sqlalchemy import func
+from models import db, Question
+
+STATS_TTL = 300
+
+"""
+QuestionStats
+    question counters in total, per category and per difficulty.
+    They are rebuilt in full with one GROUP BY query on the first read,
+    then maintained from question insert and delete events. An update
+    or bulk write, or the `ttl` expiring, which bounds drift from
+    writes made by other workers, triggers a rebuild on the next read.
+"""
+class QuestionStats:
+
+    def __init__(self, ttl=STATS_TTL):
+        self.ttl = ttl
+        self.by_category = None
+        self.by_difficulty = None
+        self.total = 0
+        self.expires = 0
+        self.lock = threading.Lock()
+
+    def rebuild(self):
+        by_category = {}
+        by_difficulty = {}
+        for category, difficulty, count in db.session.query(
+                Question.category, Question.difficulty,
+                func.count(Question.id)).group_by(
+                Question.category, Question.difficulty):
+            by_category[category] = by_category.get(category, 0) + count
+            by_difficulty[difficulty] = by_difficulty.get(difficulty, 0) + count
+        with self.lock:
+            self.by_category = by_category
+            self.by_difficulty = by_difficulty
+            self.total = sum(by_category.values())
+            self.expires = time.monotonic() + self.ttl
+            return self.by_category, self.by_difficulty, self.total
+
+    """
+    counts()
+        the (by_category, by_difficulty, total) counters, rebuilt first
+        when stale. They are read under the lock, so a concurrent event
+        that drops the counters cannot leave a reader with None.
+    """
+    def counts(self):
+        with self.lock:
+            if self.by_category is not None and \
+                    time.monotonic() < self.expires:
+                return self.by_category, self.by_difficulty, self.total
+        return self.rebuild()
+
+    def total_questions(self):
+        by_category, by_difficulty, total = self.counts()
+        return total
+
+    def category_total(self, category_id):
+        by_category, by_difficulty, total = self.counts()
+        with self.lock:
+            return by_category.get(category_id, 0)
+
+    def snapshot(self):
+        by_category, by_difficulty, total = self.counts()
+        with self.lock:
+            return {
+                "total_questions": total,
+                "categories": nonzero(by_category),
+                "difficulties": nonzero(by_difficulty)
+            }
+
+    def question_changed(self, event, question):
+        with self.lock:
+            if self.by_category is None:
+                return
+            if event == "insert":
+                step = 1
+            elif event == "delete":
+                step = -1
+            else:
+                self.by_category = None
+                return
+            self.total += step
+            self.by_category[question.category] = \
+                self.by_category.get(question.category, 0) + step
+            self.by_difficulty[question.difficulty] = \
+                self.by_difficulty.get(question.difficulty, 0) + step
+
+def nonzero(counts):
+    return dict((key, count) for key, count in counts.items()
+                if key is not None and count > 0)
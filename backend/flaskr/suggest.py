@@ -0,0 +1,114 @@
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from heapq import nsmallest
+from models import db, Question, Category
+
+SUGGEST_INDEX_TTL = 300
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+CACHED_PREFIX_LENGTH = 2
+WORD = re.compile(r"\w+")
+
+def words(text):
+    return [word for word in WORD.findall((text or "").lower())
+            if len(word) > 1]
+
+"""
+SuggestIndex
+    prefix index for search-as-you-type: the distinct words of the
+    question texts in a sorted array, with the number of questions
+    using each, plus the category names. complete() finds the words
+    starting with a prefix with two binary searches and returns the
+    most used first; results for prefixes of up to CACHED_PREFIX_LENGTH
+    characters, which match the most words, are cached until the next
+    change. The index is loaded on first use, kept current on question
+    inserts and deletes and reloaded every `ttl` seconds, or after an
+    update or bulk write, to pick up writes from other workers.
+"""
+class SuggestIndex:
+
+    def __init__(self, ttl=SUGGEST_INDEX_TTL):
+        self.ttl = ttl
+        self.terms = []
+        self.counts = {}
+        self.categories = []
+        self.cached = {}
+        self.expires = 0
+        self.lookups = 0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        counts = {}
+        for question, in db.session.query(Question.question).yield_per(1000):
+            for word in set(words(question)):
+                counts[word] = counts.get(word, 0) + 1
+        categories = sorted(
+            (category_type.lower(), category_type) for category_type, in
+            db.session.query(Category.type) if category_type)
+        with self.lock:
+            self.counts = counts
+            self.terms = sorted(counts)
+            self.categories = categories
+            self.cached = {}
+            self.expires = time.monotonic() + self.ttl
+
+    def add(self, text, step):
+        for word in set(words(text)):
+            count = self.counts.get(word, 0) + step
+            if count > 0:
+                if word not in self.counts:
+                    insort(self.terms, word)
+                self.counts[word] = count
+            elif word in self.counts:
+                del self.counts[word]
+                del self.terms[bisect_left(self.terms, word)]
+        self.cached = {}
+
+    def complete(self, prefix, limit=SUGGEST_LIMIT):
+        if time.monotonic() >= self.expires:
+            self.refresh()
+        prefix = prefix.lower()
+        with self.lock:
+            self.lookups += 1
+            key = (prefix, limit)
+            if key in self.cached:
+                return self.cached[key]
+            suggestions = [category_type for name, category_type
+                           in self.categories if name.startswith(prefix)]
+            low = bisect_left(self.terms, prefix)
+            high = bisect_left(self.terms, prefix + "\U0010ffff")
+            best = nsmallest(limit, range(low, high), key=lambda index: (
+                -self.counts[self.terms[index]], self.terms[index]))
+            suggestions = (suggestions + [self.terms[index]
+                                          for index in best])[:limit]
+            if len(prefix) <= CACHED_PREFIX_LENGTH:
+                self.cached[key] = suggestions
+            return suggestions
+
+    def question_changed(self, event, question):
+        with self.lock:
+            if not self.expires:
+                return
+            if event == "insert":
+                self.add(question.question, 1)
+            elif event == "delete":
+                self.add(question.question, -1)
+            else:
+                self.expires = 0
+
+    def category_changed(self, event, category):
+        self.expires = 0
+
+    def stats(self):
+        with self.lock:
+            size = sys.getsizeof(self.terms) + sys.getsizeof(self.counts) + \
+                sum(sys.getsizeof(term) for term in self.terms)
+            return {
+                "terms": len(self.terms),
+                "categories": len(self.categories),
+                "lookups": self.lookups,
+                "bytes": size
+            }
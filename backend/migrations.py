@@ -0,0 +1,88 @@
+from sqlalchemy import text
+from models import db
+
+"""
+Schema migrations
+
+Each migration is a (version, description, function) entry applied in
+order by upgrade(). Applied versions are recorded in the
+schema_migrations table, so upgrade() is safe to run on every deploy.
+Migrations are written to be idempotent, because databases built by
+db.create_all() already have the current schema.
+"""
+
+def column_type(table, column):
+    if db.engine.dialect.name != "postgresql":
+        return None
+    return db.session.execute(text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = :table AND column_name = :column"),
+        {"table": table, "column": column}).scalar()
+
+def has_foreign_key(table, column):
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_constraint c "
+        "JOIN pg_attribute a ON a.attrelid = c.conrelid "
+        "AND a.attnum = ANY (c.conkey) "
+        "WHERE c.conrelid = CAST(:table AS regclass) AND c.contype = 'f' "
+        "AND a.attname = :column"),
+        {"table": table, "column": column}).scalar() is not None
+
+"""
+0001: questions.category becomes an integer foreign key to categories.id,
+with composite indexes for category browsing and quiz selection
+"""
+def typed_category_and_indexes():
+    if db.engine.dialect.name == "postgresql":
+        if column_type("questions", "category") != "integer":
+            db.session.execute(text(
+                "ALTER TABLE questions ALTER COLUMN category "
+                "TYPE integer USING category::integer"))
+        if not has_foreign_key("questions", "category"):
+            db.session.execute(text(
+                "ALTER TABLE questions ADD CONSTRAINT category "
+                "FOREIGN KEY (category) REFERENCES categories (id) "
+                "ON UPDATE CASCADE ON DELETE SET NULL"))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_questions_category_id "
+        "ON questions (category, id)"))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_questions_category_difficulty "
+        "ON questions (category, difficulty)"))
+
+MIGRATIONS = [
+    (1, "typed category foreign key and indexes", typed_category_and_indexes),
+]
+
+def current_version():
+    db.session.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations "
+        "(version integer PRIMARY KEY, description text)"))
+    version = db.session.execute(text(
+        "SELECT MAX(version) FROM schema_migrations")).scalar()
+    db.session.commit()
+    return version or 0
+
+"""
+upgrade()
+    applies every migration newer than the recorded version, each in
+    its own transaction, and returns the versions applied
+"""
+def upgrade():
+    applied = []
+    version = current_version()
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        try:
+            migrate()
+            db.session.execute(text(
+                "INSERT INTO schema_migrations (version, description) "
+                "VALUES (:version, :description)"),
+                {"version": migration_version, "description": description})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        applied.append(migration_version)
+    return applied
@@ -1,38 +1,206 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+import itertools
+import threading
+import time
+from flask import current_app, g, has_request_context
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, \
+    create_engine, orm
+from sqlalchemy.pool import QueuePool
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import json
-from settings import DB_NAME, DB_USER, DB_PASSWORD
+from settings import DB_NAME, DB_USER, DB_PASSWORD, DB_POOL_SIZE, \
+    DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, \
+    DB_STATEMENT_TIMEOUT, DB_REPLICA_URLS
 
 database_name = DB_NAME
 database_path = "postgresql://{}:{}@{}/{}".format(
     DB_USER, DB_PASSWORD, "localhost:5432", database_name
 )
 
-db = SQLAlchemy()
+"""
+RoutingSession
+    sends the queries of read-only requests to the read replica chosen
+    for the request (g.db_replica); flushes, and therefore every insert
+    and delete, always go to the primary
+"""
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and has_request_context():
+            replica = g.get("db_replica")
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+db = RoutingSQLAlchemy()
+
+"""
+InstrumentedQueuePool
+    a QueuePool that counts checkouts, and how many of them had to wait
+    for a connection because the pool and its overflow were exhausted,
+    along with the total time spent waiting
+"""
+class InstrumentedQueuePool(QueuePool):
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kw):
+        super().__init__(creator, pool_size=pool_size,
+                         max_overflow=max_overflow, **kw)
+        self.max_overflow_limit = max_overflow
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.metrics_lock = threading.Lock()
+
+    def _do_get(self):
+        exhausted = self.max_overflow_limit >= 0 and \
+            self.checkedout() >= self.size() + self.max_overflow_limit
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            with self.metrics_lock:
+                self.checkouts += 1
+                if exhausted:
+                    self.waits += 1
+                    self.wait_time += time.perf_counter() - start
+
+    def stats(self):
+        with self.metrics_lock:
+            return {
+                "size": self.size(),
+                "checked_in": self.checkedin(),
+                "checked_out": self.checkedout(),
+                "overflow": max(self.overflow(), 0),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_time": self.wait_time
+            }
+
+"""
+engine_options(app, database_path)
+    pool settings from app.config, falling back to settings.py and the
+    environment. SQLite keeps SQLAlchemy's default pool.
+"""
+def engine_options(app, database_path):
+    if database_path.startswith("sqlite"):
+        return {}
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": app.config.get("DB_POOL_SIZE", DB_POOL_SIZE),
+        "max_overflow": app.config.get("DB_MAX_OVERFLOW", DB_MAX_OVERFLOW),
+        "pool_timeout": app.config.get("DB_POOL_TIMEOUT", DB_POOL_TIMEOUT),
+        "pool_recycle": app.config.get("DB_POOL_RECYCLE", DB_POOL_RECYCLE),
+        "pool_pre_ping": app.config.get("DB_POOL_PRE_PING", DB_POOL_PRE_PING)
+    }
+    statement_timeout = app.config.get(
+        "DB_STATEMENT_TIMEOUT", DB_STATEMENT_TIMEOUT)
+    if statement_timeout and database_path.startswith("postgresql"):
+        options["connect_args"] = {
+            "options": "-c statement_timeout={}".format(statement_timeout)
+        }
+    return options
+
+"""
+pool_stats()
+    live statistics of the current app's connection pool
+"""
+def pool_stats():
+    pool = db.get_engine().pool
+    if isinstance(pool, InstrumentedQueuePool):
+        return pool.stats()
+    return {"status": pool.status()}
+
+"""
+setup_replicas(app)
+    creates an engine for every read replica URI in
+    SQLALCHEMY_REPLICA_URIS (or DB_REPLICA_URLS)
+"""
+def setup_replicas(app):
+    replica_uris = app.config.get("SQLALCHEMY_REPLICA_URIS", DB_REPLICA_URLS)
+    replicas = [create_engine(uri, **engine_options(app, uri))
+                for uri in replica_uris]
+    app.extensions["db_replicas"] = replicas
+    app.extensions["db_replica_cycle"] = itertools.cycle(replicas)
+
+"""
+choose_replica()
+    the next read replica of the current app, round-robin,
+    or None when no replica is configured
+"""
+def choose_replica():
+    if not current_app.extensions.get("db_replicas"):
+        return None
+    return next(current_app.extensions["db_replica_cycle"])
 
 """
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service. Nothing connects
+    to the database until the first query; the tables are created by
+    `flask init-db` (see init_db).
 """
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        app, database_path)
+    setup_replicas(app)
     db.app = app
     db.init_app(app)
+
+"""
+init_db()
+    creates the missing tables of the current app's database
+"""
+def init_db():
     db.create_all()
 
+"""
+add_question_listener(app, listener)
+    registers listener(event, question) to be called after a question
+    is inserted, updated or deleted, so in-process indexes can stay up to
+    date. Bulk writes send a "reset" event with no question.
+"""
+def add_question_listener(app, listener):
+    app.extensions.setdefault("question_listeners", []).append(listener)
+
+def notify_question_listeners(event, question):
+    for listener in current_app.extensions.get("question_listeners", []):
+        listener(event, question)
+
+"""
+add_category_listener(app, listener)
+    registers listener(event, category) to be called after a category
+    is inserted, updated or deleted
+"""
+def add_category_listener(app, listener):
+    app.extensions.setdefault("category_listeners", []).append(listener)
+
+def notify_category_listeners(event, category):
+    for listener in current_app.extensions.get("category_listeners", []):
+        listener(event, category)
+
 """
 Question
 
 """
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+        Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey(
+        'categories.id', name='category',
+        onupdate='CASCADE', ondelete='SET NULL'))
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -44,13 +212,33 @@ class Question(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        notify_question_listeners("insert", self)
 
     def update(self):
         db.session.commit()
+        notify_question_listeners("update", self)
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        notify_question_listeners("delete", self)
+
+    @classmethod
+    def bulk_insert(cls, rows):
+        db.session.bulk_insert_mappings(cls, rows)
+        db.session.commit()
+        notify_question_listeners("reset", None)
+
+    @classmethod
+    def bulk_delete(cls, ids):
+        deleted = [question_id for question_id, in
+                   db.session.query(cls.id).filter(cls.id.in_(ids))]
+        if deleted:
+            cls.query.filter(cls.id.in_(deleted)).delete(
+                synchronize_session=False)
+            db.session.commit()
+            notify_question_listeners("reset", None)
+        return deleted
 
     def format(self):
         return {
@@ -74,6 +262,20 @@ class Category(db.Model):
     def __init__(self, type):
         self.type = type
 
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+        notify_category_listeners("insert", self)
+
+    def update(self):
+        db.session.commit()
+        notify_category_listeners("update", self)
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+        notify_category_listeners("delete", self)
+
     def format(self):
         return {
             'id': self.id,
@@ -4,4 +4,15 @@ load_dotenv()
 DB_NAME = os.environ.get("DB_NAME")
 DB_NAME2 = os.environ.get("DB_NAME2")
 DB_USER=os.environ.get("DB_USER")
-DB_PASSWORD = os.environ.get("DB_PASSWORD")
\ No newline at end of file
+DB_PASSWORD = os.environ.get("DB_PASSWORD")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT = int(os.environ.get("DB_STATEMENT_TIMEOUT", 0))
+
+DB_REPLICA_URLS = [url for url in
+                   os.environ.get("DB_REPLICA_URLS", "").split(",") if url]
+DB_PRIMARY_STICKY_SECONDS = int(os.environ.get("DB_PRIMARY_STICKY_SECONDS", 5))
+SECRET_KEY = os.environ.get("SECRET_KEY")
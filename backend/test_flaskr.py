@@ -1,32 +1,42 @@
 import os
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
-from flaskr import create_app
-from models import setup_db, Question, Category
+import tempfile
+import threading
+import time
+from unittest import mock
+from flaskr import create_app, QUERY_BUDGETS
+from flaskr.budget import query_budget, QueryBudgetExceeded
+from flaskr.search import InvertedIndexSearch
+from flaskr import quiz
+from models import init_db, Question, Category
+import migrations
+from sqlalchemy import create_engine, func, select
 from settings import DB_NAME2, DB_USER, DB_PASSWORD
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
+    database_name = DB_NAME2
+    database_path = "postgresql://{}:{}@{}/{}".format(DB_USER, DB_PASSWORD, "localhost:5432", database_name)
+
+    @classmethod
+    def setUpClass(cls):
+        """Create the test database tables once for the whole test case."""
+        app = create_app({"DATABASE_PATH": cls.database_path})
+        with app.app_context():
+            init_db()
+
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
+        self.app = create_app({"DATABASE_PATH": self.database_path,
+                               "QUERY_BUDGET_MODE": "raise"})
         self.client = self.app.test_client
-        self.database_name = DB_NAME2
-        self.database_path = "postgresql://{}:{}@{}/{}".format(DB_USER, DB_PASSWORD, "localhost:5432", self.database_name)
-        setup_db(self.app, self.database_path)
 
         self.test_question = {"question": "What is the nearest planet to th sun", "answer": "Mercury","difficulty": "3","category":"1"}
         self.test_question_1 = {"question": "What is the nearest planet to th sun", "answer": "Mercury", "difficulty": "3"}
         self.test_quiz = {'quiz_category': {'type': 'Sports', 'id': '6'},'previous_questions': [10]}
         self.test_quiz_1 = {'quiz_category': {'type': 'Sports', 'id': '6'}}
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
     
     def tearDown(self):
         """Executed after reach test"""
@@ -46,6 +56,129 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(status_code, 200)
         self.assertEqual(value['success'], True)
 
+    def test_for_quiz_question_is_unseen_and_in_category(self):
+        client = self.client()
+        created = [json.loads(client.post(
+            '/questions?compact=true', json=self.test_question).data)['created']
+            for index in range(2)]
+        previous = created[:1]
+        try:
+            res = client.post('/quizzes', json={
+                'quiz_category': {'type': 'Science', 'id': '1'},
+                'previous_questions': previous})
+            value = json.loads(res.data)
+            #compare if app return the correct data
+            self.assertEqual(res.status_code, 200)
+            self.assertIsNotNone(value['question'])
+            self.assertNotIn(value['question']['id'], previous)
+            self.assertEqual(str(value['question']['category']), '1')
+        finally:
+            client.delete('/questions', json={'ids': created})
+
+    def test_for_retrive_batch_of_quiz_questions(self):
+        client = self.client()
+        res = client.post('/quizzes', json={
+            'quiz_category': {'type': 'ALL', 'id': 0},
+            'previous_questions': [10], 'count': 5})
+        value = json.loads(res.data)
+        served = [question['id'] for question in value['questions']]
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(served), 5)
+        self.assertEqual(len(set(served)), 5)
+        self.assertNotIn(10, served)
+
+    def test_for_quiz_session_serves_unseen_questions(self):
+        client = self.client()
+        res = client.post('/quizzes/sessions', json=self.test_quiz_1)
+        value = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(value['session'])
+        served = []
+        token = value['session']
+        while True:
+            res = client.post('/quizzes/sessions/' + token)
+            value = json.loads(res.data)
+            if value['question'] is None:
+                break
+            self.assertEqual(value['question']['category'], 6)
+            served.append(value['question']['id'])
+            token = value['session']
+        #compare if app return the correct data
+        self.assertTrue(len(served))
+        self.assertEqual(len(served), len(set(served)))
+
+    def test_for_quiz_session_served_by_another_worker(self):
+        config = {"DATABASE_PATH": self.database_path,
+                  "SECRET_KEY": "quiz session secret"}
+        client = create_app(config).test_client()
+        res = client.post('/quizzes/sessions', json=self.test_quiz_1)
+        token = json.loads(res.data)['session']
+        other_client = create_app(config).test_client()
+        res = other_client.post('/quizzes/sessions/' + token)
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(value['question']['category'], 6)
+        res = client.post('/quizzes/sessions/' + token[:-1] + 'x')
+        self.assertEqual(res.status_code, 404)
+
+    def test_for_quiz_session_rounds_independent_of_id_range(self):
+        def rounds(spacing):
+            selector = quiz.QuizSelector()
+            selector.load([(index * spacing, 1) for index in range(1, 6)])
+            selector.fetch = lambda ids: dict(
+                (question_id, Question("q", "a", 1, 1)) for question_id in ids)
+            sessions = quiz.QuizSessions(selector, "secret")
+            token = sessions.start(1)
+            steps = []
+            with mock.patch.object(quiz, "permute",
+                                   wraps=quiz.permute) as permute:
+                while True:
+                    question, token = sessions.next_question(token)
+                    steps.append(permute.call_count)
+                    permute.reset_mock()
+                    if question is None:
+                        break
+            return steps
+        for spacing in [1, 1000000000]:
+            steps = rounds(spacing)
+            #compare if app return the correct data
+            self.assertEqual(len(steps), 6)
+            self.assertTrue(sum(steps) <= 16, steps)
+            self.assertEqual(steps[-1], 0)
+
+    def test_for_quiz_pools_reloaded_by_one_thread(self):
+        selector = quiz.QuizSelector()
+        selector.load([(10, 6), (11, 6)])
+        selector.expires = 0
+        reloading = threading.Event()
+        finish = threading.Event()
+        reloads = []
+        def refresh():
+            reloads.append(1)
+            reloading.set()
+            finish.wait(5)
+            selector.load([(10, 6), (11, 6), (12, 6)])
+        selector.refresh = refresh
+        reloader = threading.Thread(target=selector.pool, args=(6,))
+        reloader.start()
+        reloading.wait(5)
+        pools = [len(selector.pool(6)) for index in range(3)]
+        finish.set()
+        reloader.join()
+        #compare if app return the correct data
+        self.assertEqual(reloads, [1])
+        self.assertEqual(pools, [2, 2, 2])
+        self.assertEqual(len(selector.pool(6)), 3)
+
+    def test_404_for_unknown_quiz_session(self):
+        client = self.client()
+        res = client.post('/quizzes/sessions/unknown')
+        value = json.loads(res.data)
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(value["success"], False)
+
     def test_422_if_full_data_are_not_passed(self):
         client = self.client()
         res = client.post('/quizzes', json=self.test_quiz_1)
@@ -130,6 +263,52 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(len(value["questions"]), 0)
         self.assertEqual(value["total_questions"], 0)
 
+    def test_for_empty_search_index_keeps_inserted_questions(self):
+        index = InvertedIndexSearch()
+        question = Question("Which planet is red", "Mars", 1, 1)
+        question.id = 100000
+        index.question_changed("insert", question)
+        self.assertEqual(index.texts, {})
+        #an index loaded from an empty table
+        index.expires = time.monotonic() + index.ttl
+        index.question_changed("insert", question)
+        self.assertEqual(index.candidates("question", "planet"), {100000})
+
+    def test_for_search_suggestions(self):
+        client = self.client()
+        res = client.get("/search/suggest?q=whose tit")
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(value["success"], True)
+        self.assertIn("whose title", value["suggestions"])
+        res = client.get("/search/suggest?q=scie")
+        self.assertIn("Science", json.loads(res.data)["suggestions"])
+        client.post("/questions?compact=true", json=self.test_question)
+        res = client.get("/search/suggest?q=neares")
+        self.assertIn("nearest", json.loads(res.data)["suggestions"])
+
+    def test_for_search_suggestions_without_query(self):
+        client = self.client()
+        res = client.get("/search/suggest?q=")
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(value["suggestions"], [])
+
+    def test_for_search_including_answers(self):
+        client = self.client()
+        res = client.post("/search", json={"searchTerm": "angelou"})
+        value = json.loads(res.data)
+        self.assertEqual(value["total_questions"], 0)
+        res = client.post("/search", json={"searchTerm": "angelou",
+                                           "includeAnswers": True})
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(value["total_questions"], 1)
+        self.assertEqual(value["questions"][0]["answer"], "Maya Angelou")
+
     def test_for_422_if_correct_varaible_name_is_not_provided(self):
         client = self.client()
         res = client.post("/search", json={"sech": "titel"})
@@ -184,6 +363,127 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(value["success"], False)
         self.assertEqual(value["message"], "unprocessable")
 
+    def test_for_422_if_category_does_not_exist(self):
+        client = self.client()
+        res = client.post("/questions", json=dict(self.test_question,
+                                                  category="1000"))
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(value["success"], False)
+
+    def test_for_bulk_import_of_questions(self):
+        client = self.client()
+        rows = [json.dumps(self.test_question), "{not json",
+                json.dumps(self.test_question_1)]
+        res = client.post("/questions/import?batch_size=1",
+                          data="\n".join(rows),
+                          content_type="application/x-ndjson")
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(value["imported"], 1)
+        self.assertEqual(value["rejected"], 2)
+        self.assertEqual([error["row"] for error in value["errors"]], [2, 3])
+
+    def test_for_bulk_import_rejects_rows_that_are_not_utf8(self):
+        client = self.client()
+        rows = ["question,answer,difficulty,category",
+                "Caf\u00e9 of the year?,Flore,2,900",
+                "Which planet is red?,Mars,1,900"]
+        res = client.post("/questions/import",
+                          data="\n".join(rows).encode("latin-1"),
+                          content_type="text/csv")
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(value["imported"], 0)
+        self.assertEqual(value["errors"], [
+            {"row": 1, "error": "invalid utf-8"},
+            {"row": 2, "error": "unknown category 900"}])
+
+    def test_422_for_bulk_import_with_unknown_format(self):
+        client = self.client()
+        res = client.post("/questions/import?format=xml", data="")
+        self.assertEqual(res.status_code, 422)
+
+    def test_for_export_questions_of_category(self):
+        client = self.client()
+        res = client.get("/questions/export?category=3")
+        rows = [json.loads(line) for line in res.data.decode().splitlines()]
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(row["category"] == 3 for row in rows))
+
+    def test_for_export_questions_as_csv(self):
+        client = self.client()
+        res = client.get("/questions/export?format=csv")
+        lines = res.data.decode().splitlines()
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(lines[0], "id,question,answer,difficulty,category")
+        self.assertTrue(len(lines) > 1)
+
+    """
+    Test for read replica routing
+    """
+    def test_for_writes_pin_client_to_primary(self):
+        client = self.client()
+        res = client.post("/questions?compact=true", json=self.test_question)
+        #compare if app return the correct data
+        self.assertIn("trivia_primary_until", res.headers.get("Set-Cookie"))
+        res = client.post("/search", json={"searchTerm": "title"})
+        self.assertIsNone(res.headers.get("Set-Cookie"))
+
+    def test_for_reads_from_replica(self):
+        path = os.path.join(tempfile.mkdtemp(), "replica.db")
+        replica = create_engine("sqlite:///" + path)
+        Question.metadata.create_all(replica)
+        with replica.begin() as connection:
+            connection.execute(Category.__table__.insert(),
+                               {"id": 1, "type": "Science"})
+            connection.execute(Question.__table__.insert(), {
+                "question": "Which database answered?", "answer": "replica",
+                "category": 1, "difficulty": 1})
+        app = create_app({"DATABASE_PATH": self.database_path,
+                          "SQLALCHEMY_REPLICA_URIS": ["sqlite:///" + path]})
+        client = app.test_client()
+        res = client.get("/questions?after=0")
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([question["question"] for question in
+                          value["questions"]], ["Which database answered?"])
+        res = client.post("/questions?compact=true", json=self.test_question)
+        created = json.loads(res.data)["created"]
+        try:
+            with self.app.app_context():
+                self.assertIsNotNone(Question.query.filter(
+                    Question.id == created).one_or_none())
+            with replica.connect() as connection:
+                self.assertEqual(connection.execute(select(
+                    [func.count()]).select_from(Question.__table__)).scalar(),
+                    1)
+            res = client.get("/questions?after=0")
+            questions = [question["question"] for question in
+                         json.loads(res.data)["questions"]]
+            self.assertTrue(len(questions))
+            self.assertNotIn("Which database answered?", questions)
+        finally:
+            client.delete("/questions/{}".format(created))
+
+    """
+    Test for schema migrations
+    """
+    def test_for_upgrade_is_idempotent(self):
+        with self.app.app_context():
+            migrations.upgrade()
+            self.assertEqual(migrations.upgrade(), [])
+            self.assertEqual(migrations.current_version(),
+                             migrations.MIGRATIONS[-1][0])
+
     """
     Test for delete questions
     """
@@ -204,6 +504,50 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(value["questions"]))
         self.assertTrue(value["total_questions"])
 
+    def test_for_compact_write_responses(self):
+        client = self.client()
+        res = client.post("/questions?compact=true", json=self.test_question)
+        created = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("questions", created)
+        res = client.delete("/questions/{}?compact=true".format(
+            created["created"]))
+        deleted = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("questions", deleted)
+        self.assertEqual(deleted["deleted"], created["created"])
+        self.assertEqual(deleted["total_questions"],
+                         created["total_questions"] - 1)
+
+    def test_for_bulk_delete_questions(self):
+        client = self.client()
+        created = [json.loads(client.post(
+            "/questions?compact=true", json=self.test_question).data)["created"]
+            for index in range(3)]
+        res = client.delete("/questions", json={"ids": created + [100000]})
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(sorted(value["deleted"]), sorted(created))
+        self.assertEqual(
+            Question.query.filter(Question.id.in_(created)).count(), 0)
+
+    def test_422_for_bulk_delete_without_ids(self):
+        client = self.client()
+        res = client.delete("/questions", json={"ids": []})
+        self.assertEqual(res.status_code, 422)
+
+    def test_422_for_bulk_delete_with_boolean_ids(self):
+        client = self.client()
+        total = Question.query.count()
+        res = client.delete("/questions", json={"ids": [True]})
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(value["success"], False)
+        self.assertEqual(Question.query.count(), total)
+
     def test_for_422_if_question_does_not_found(self):
         client = self.client()
         res = client.delete("/questions/1000")
@@ -239,7 +583,147 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(value["questions"]))
         self.assertTrue(value["total_questions"])
         self.assertTrue(len(value['categories']))
- 
+
+    def test_for_second_page_of_questions(self):
+        client = self.client()
+        res = client.get("/questions?page=2")
+        value = json.loads(res.data)
+        status_code = res.status_code
+        first_id = Question.query.order_by(Question.id).offset(10).first().id
+        #compare if app return the correct data
+        self.assertEqual(status_code, 200)
+        self.assertTrue(len(value["questions"]) <= 10)
+        self.assertEqual(value["questions"][0]["id"], first_id)
+
+    def test_for_retrieve_questions_with_cursor(self):
+        client = self.client()
+        res = client.get("/questions?after=0&limit=5&estimate=true")
+        value = json.loads(res.data)
+        status_code = res.status_code
+        #compare if app return the correct data
+        self.assertEqual(status_code, 200)
+        self.assertEqual(len(value["questions"]), 5)
+        self.assertEqual(value["next_cursor"], value["questions"][-1]["id"])
+        self.assertTrue(value["total_questions"])
+        res = client.get("/questions?after={}&limit=5".format(
+            value["next_cursor"]))
+        next_value = json.loads(res.data)
+        self.assertTrue(next_value["questions"][0]["id"] > value["next_cursor"])
+
+    def test_for_304_if_questions_not_modified(self):
+        client = self.client()
+        res = client.get("/questions")
+        etag = res.headers["ETag"]
+        res = client.get("/questions", headers={"If-None-Match": etag})
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers["ETag"], etag)
+        created = json.loads(client.post(
+            "/questions?compact=true", json=self.test_question).data)["created"]
+        res = client.get("/questions", headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 200)
+        client.delete("/questions/{}?compact=true".format(created))
+
+    def test_for_pinned_client_bypasses_response_cache(self):
+        client = self.client()
+        url = "/categories/1/questions"
+        client.get(url)
+        other_client = create_app(
+            {"DATABASE_PATH": self.database_path}).test_client()
+        created = json.loads(other_client.post(
+            "/questions?compact=true", json=self.test_question).data)["created"]
+        try:
+            stale = json.loads(client.get(url).data)
+            client.set_cookie("localhost", "trivia_primary_until",
+                              str(time.time() + 60))
+            fresh = json.loads(client.get(url).data)
+            #compare if app return the correct data
+            self.assertNotIn(created, [question["id"] for question
+                                       in stale["questions"]])
+            self.assertIn(created, [question["id"] for question
+                                    in fresh["questions"]])
+        finally:
+            other_client.delete("/questions/{}".format(created))
+
+    def test_for_question_fragments_are_reused(self):
+        client = self.client()
+        fragments = self.app.extensions['question_fragments']
+        res = client.post('/search', json={'searchTerm': 'title'})
+        hits = fragments.stats()['hits']
+        again = client.post('/search', json={'searchTerm': 'title'})
+        #compare if app return the correct data
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.data, res.data)
+        self.assertTrue(fragments.stats()['hits'] > hits)
+        question_id = json.loads(res.data)['questions'][0]['id']
+        with self.app.app_context():
+            question = Question.query.filter(Question.id == question_id).one()
+            original = question.difficulty
+            question.difficulty = original % 5 + 1
+            question.update()
+            difficulty = question.difficulty
+        try:
+            value = json.loads(client.post('/search',
+                                           json={'searchTerm': 'title'}).data)
+            self.assertEqual(value['questions'][0]['difficulty'], difficulty)
+        finally:
+            with self.app.app_context():
+                question = Question.query.filter(
+                    Question.id == question_id).one()
+                question.difficulty = original
+                question.update()
+
+    def test_for_questions_served_from_snapshot(self):
+        path = os.path.join(tempfile.mkdtemp(), "questions.snapshot")
+        snapshot_app = create_app({"DATABASE_PATH": self.database_path,
+                                   "SNAPSHOT_PATH": path})
+        snapshot_client = snapshot_app.test_client()
+        client = self.client()
+        for url in ["/questions?page=2", "/questions?after=0&limit=5",
+                    "/categories/3/questions"]:
+            res = snapshot_client.get(url)
+            value = json.loads(res.data)
+            expected = json.loads(client.get(url).data)
+            #compare if app return the correct data
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(value["questions"], expected["questions"])
+        stats = snapshot_app.extensions["question_snapshot"].stats()
+        self.assertEqual(stats["questions"], Question.query.count())
+
+    def test_for_snapshot_rebuilt_after_cli_import_and_when_expired(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "questions.snapshot")
+        snapshot_app = create_app({"DATABASE_PATH": self.database_path,
+                                   "SNAPSHOT_PATH": path})
+        snapshot = snapshot_app.extensions["question_snapshot"]
+        snapshot_client = snapshot_app.test_client()
+        snapshot_client.get("/questions")
+        import_path = os.path.join(directory, "questions.ndjson")
+        with open(import_path, "w") as import_file:
+            import_file.write(json.dumps(self.test_question))
+        result = snapshot_app.test_cli_runner().invoke(
+            args=["import-questions", import_path])
+        try:
+            #compare if app return the correct data
+            self.assertIn("imported 1", result.output)
+            self.assertIsNone(snapshot.worker)
+            self.assertEqual(snapshot.stats()["rebuilds"], 2)
+            snapshot_client.get("/questions")
+            self.assertEqual(snapshot.stats()["questions"],
+                             Question.query.count())
+            os.utime(path, (0, 0))
+            snapshot_client.get("/categories/1/questions")
+            worker = snapshot.worker
+            if worker is not None:
+                worker.join()
+            self.assertEqual(snapshot.stats()["rebuilds"], 3)
+        finally:
+            with self.app.app_context():
+                Question.query.filter(
+                    Question.question == self.test_question["question"]
+                ).delete()
+                Question.query.session.commit()
+
     def test_for_404_requesting_beyond_valid_page(self):
         client = self.client()
         res = client.get("/questions?page=1000")
@@ -250,6 +734,201 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(value["success"], False)
         self.assertEqual(value["message"], "resource not found")
 
+    """
+    Test for question statistics
+    """
+    def test_for_retrieve_stats(self):
+        client = self.client()
+        res = client.get('/stats')
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(value['total_questions'], Question.query.count())
+        self.assertEqual(value['categories']['3'], 3)
+        self.assertEqual(sum(value['difficulties'].values()),
+                         value['total_questions'])
+
+    def test_for_stats_follow_writes(self):
+        client = self.client()
+        before = json.loads(client.get('/stats').data)
+        client.post('/questions', json=self.test_question)
+        after = json.loads(client.get('/stats').data)
+        #compare if app return the correct data
+        self.assertEqual(after['total_questions'],
+                         before['total_questions'] + 1)
+        self.assertEqual(after['categories']['1'],
+                         before['categories'].get('1', 0) + 1)
+
+    def test_for_retrieve_pool_stats(self):
+        client = self.client()
+        client.get('/questions')
+        res = client.get('/stats/pool')
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(value['success'], True)
+        self.assertTrue(value['checkouts'] >= 1)
+        self.assertIn('wait_time', value)
+
+    """
+    Test for metrics
+    """
+    def test_for_retrieve_metrics(self):
+        client = self.client()
+        client.get('/questions')
+        res = client.get('/metrics')
+        body = res.data.decode()
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('trivia_requests_total{route="/questions",method="GET",'
+                      'status="200"} 1', body)
+        self.assertIn('trivia_request_duration_seconds_bucket{route='
+                      '"/questions",method="GET",status="200",le="+Inf"} 1',
+                      body)
+        self.assertIn('trivia_sql_statements_total{route="/questions"', body)
+
+    def test_for_404_if_metrics_disabled(self):
+        app = create_app({"DATABASE_PATH": self.database_path,
+                          "METRICS_ENABLED": False})
+        res = app.test_client().get('/metrics')
+        self.assertEqual(res.status_code, 404)
+
+    """
+    Test for query budgets
+    """
+    def test_for_every_endpoint_within_query_budget(self):
+        client = self.client()
+        created = [json.loads(client.post(
+            "/questions?compact=true", json=self.test_question).data)["created"]
+            for index in range(2)]
+        session = json.loads(client.post(
+            "/quizzes/sessions", json=self.test_quiz_1).data)["session"]
+        calls = [
+            ("retrieve_categories", "get", "/categories", None),
+            ("retrieve_questions", "get", "/questions", None),
+            ("retrieve_questions", "get", "/questions?after=0&estimate=true",
+             None),
+            ("retrieve_questions_by_category", "get",
+             "/categories/3/questions", None),
+            ("search_questions", "post", "/search", {"searchTerm": "title"}),
+            ("suggest_questions", "get", "/search/suggest?q=ti", None),
+            ("retrive_quiz_questions", "post", "/quizzes", self.test_quiz),
+            ("retrive_quiz_questions", "post", "/quizzes",
+             dict(self.test_quiz, count=5)),
+            ("start_quiz_session", "post", "/quizzes/sessions",
+             self.test_quiz_1),
+            ("retrieve_quiz_session_question", "post",
+             "/quizzes/sessions/" + session, None),
+            ("create_question", "post", "/questions", self.test_question),
+            ("delete_question", "delete", "/questions/{}".format(created[0]),
+             None),
+            ("delete_questions_in_bulk", "delete", "/questions",
+             {"ids": created[1:]}),
+            ("import_questions_in_bulk", "post", "/questions/import",
+             json.dumps(self.test_question)),
+            ("export_questions_in_bulk", "get", "/questions/export", None),
+            ("retrieve_stats", "get", "/stats", None),
+            ("retrieve_pool_stats", "get", "/stats/pool", None),
+            ("retrieve_metrics", "get", "/metrics", None),
+        ]
+        endpoints = set(self.app.view_functions) - {"static"}
+        #compare if app return the correct data
+        self.assertEqual(set(QUERY_BUDGETS), endpoints)
+        self.assertEqual(set(call[0] for call in calls), endpoints)
+        try:
+            for endpoint, method, url, body in calls:
+                if isinstance(body, str):
+                    res = getattr(client, method)(
+                        url, data=body, content_type="application/x-ndjson")
+                else:
+                    res = getattr(client, method)(url, json=body)
+                self.assertEqual(res.status_code, 200, url)
+                self.assertTrue(int(res.headers["X-Query-Count"]) <=
+                                QUERY_BUDGETS[endpoint], url)
+        finally:
+            with self.app.app_context():
+                Question.query.filter(
+                    Question.question == self.test_question["question"]
+                ).delete()
+                Question.query.session.commit()
+
+    def test_for_query_budget_exceeded(self):
+        with self.app.app_context():
+            with self.assertRaises(QueryBudgetExceeded):
+                with query_budget(1):
+                    Question.query.all()
+                    Category.query.all()
+
+    """
+    Test for admission control
+    """
+    def test_429_if_client_exceeds_rate_limit(self):
+        app = create_app({"DATABASE_PATH": self.database_path,
+                          "ADMISSION_LIMITS": {
+                              "search_questions": {"rate": 1, "burst": 2}}})
+        client = app.test_client()
+        statuses = [client.post("/search", json={"searchTerm": "title"})
+                    for attempt in range(3)]
+        value = json.loads(statuses[-1].data)
+        #compare if app return the correct data
+        self.assertEqual([res.status_code for res in statuses],
+                         [200, 200, 429])
+        self.assertEqual(value["message"], "too many requests")
+        self.assertEqual(statuses[-1].headers["Retry-After"], "1")
+        stats = app.extensions["admission_control"].stats()
+        self.assertEqual(stats["search_questions_rate_rejected"], 1)
+
+    def test_503_if_endpoint_is_at_concurrency_limit(self):
+        admission_control = self.app.extensions["admission_control"]
+        slot = admission_control.concurrency["retrive_quiz_questions"]
+        for taken in range(slot.limit):
+            slot.acquire()
+        client = self.client()
+        res = client.post("/quizzes", json=self.test_quiz)
+        value = json.loads(res.data)
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(value["message"], "service unavailable")
+        self.assertEqual(res.headers["Retry-After"], "1")
+        for taken in range(slot.limit):
+            slot.release()
+        res = client.post("/quizzes", json=self.test_quiz)
+        self.assertEqual(res.status_code, 200)
+
+    def test_for_app_startup_runs_no_queries(self):
+        with query_budget(0, "create_app") as counter:
+            app = create_app({"DATABASE_PATH": self.database_path})
+        #compare if app return the correct data
+        self.assertEqual(counter.count, 0)
+        res = app.test_client().get("/categories")
+        self.assertEqual(res.status_code, 200)
+
+    """
+    Test for request profiling
+    """
+    def test_for_profiling_authorized_requests(self):
+        directory = tempfile.mkdtemp()
+        app = create_app({"DATABASE_PATH": self.database_path,
+                          "PROFILING_ENABLED": True,
+                          "PROFILE_TOKEN": "secret",
+                          "PROFILE_DIR": directory})
+        client = app.test_client()
+        client.post("/search", json={"searchTerm": "title"},
+                    headers={"X-Profile": "wrong"})
+        res = client.post("/search", json={"searchTerm": "title"},
+                          headers={"X-Profile": "s\u00e9cret"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(os.listdir(directory), [])
+        for index in range(2):
+            client.post("/search", json={"searchTerm": "title"},
+                        headers={"X-Profile": "secret"})
+        files = sorted(os.listdir(directory))
+        #compare if app return the correct data
+        self.assertEqual(len(files), 4)
+        self.assertTrue(files[0].startswith("search-"))
+        self.assertTrue(files[0].endswith(".collapsed"))
+        self.assertTrue(files[1].endswith(".pstats"))
+
     """
     Test for get categories
     """
@@ -266,6 +945,17 @@ class TriviaTestCase(unittest.TestCase):
         #assure if the app return data
         self.assertTrue(len(value['categories']))
 
+    def test_for_categories_are_served_from_cache(self):
+        category_cache = self.app.extensions['category_cache']
+        with self.app.app_context():
+            categories = category_cache.get()
+            cached = category_cache.get()
+        stats = category_cache.stats()
+        #compare if app return the correct data
+        self.assertEqual(cached, categories)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
     def test_for_404_non_existing_category(self):
         client = self.client()
         res = client.get('/categories/9999')
@@ -279,6 +969,44 @@ class TriviaTestCase(unittest.TestCase):
 
  
 
+class AsyncTriviaTestCase(unittest.TestCase):
+    """This class represents the async (ASGI) trivia test case"""
+
+    def setUp(self):
+        """Define test variables and initialize the async app."""
+        from starlette.testclient import TestClient
+        from flaskr.asgi import create_async_app
+        self.database_path = "postgresql://{}:{}@{}/{}".format(DB_USER, DB_PASSWORD, "localhost:5432", DB_NAME2)
+        self.client = TestClient(create_async_app(self.database_path))
+
+    def test_for_retrieve_paginated_questions(self):
+        with self.client as client:
+            res = client.get("/questions")
+            value = res.json()
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(len(value["questions"]))
+        self.assertTrue(value["total_questions"])
+        self.assertTrue(len(value["categories"]))
+
+    def test_for_retrive_quiz_questions(self):
+        with self.client as client:
+            res = client.post("/quizzes", json={
+                "quiz_category": {"type": "Sports", "id": "6"},
+                "previous_questions": [10]})
+            value = res.json()
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(value["question"]["id"], 10)
+
+    def test_for_404_requesting_beyond_valid_page(self):
+        with self.client as client:
+            res = client.get("/questions?page=1000")
+            value = res.json()
+        #compare if app return the correct data
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(value["message"], "resource not found")
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
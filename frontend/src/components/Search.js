@@ -1,8 +1,10 @@
 import React, { Component } from 'react';
+import $ from 'jquery';
 
 class Search extends Component {
   state = {
     query: '',
+    suggestions: [],
   };
 
   getInfo = (event) => {
@@ -14,6 +16,28 @@ class Search extends Component {
     this.setState({
       query: this.search.value,
     });
+    this.getSuggestions(this.search.value);
+  };
+
+  getSuggestions = (query) => {
+    if (this.pendingSuggestions) {
+      this.pendingSuggestions.abort();
+    }
+    if (!query.trim()) {
+      this.setState({ suggestions: [] });
+      return;
+    }
+    this.pendingSuggestions = $.ajax({
+      url: `/search/suggest?q=${encodeURIComponent(query)}`,
+      type: 'GET',
+      success: (result) => {
+        this.setState({ suggestions: result.suggestions });
+        return;
+      },
+      error: () => {
+        return;
+      },
+    });
   };
 
   render() {
@@ -23,7 +47,13 @@ class Search extends Component {
           placeholder='Search questions...'
           ref={(input) => (this.search = input)}
           onChange={this.handleInputChange}
+          list='search-suggestions'
         />
+        <datalist id='search-suggestions'>
+          {this.state.suggestions.map((suggestion) => (
+            <option key={suggestion} value={suggestion} />
+          ))}
+        </datalist>
         <input type='submit' value='Submit' className='button' />
       </form>
     );